@@ -1,10 +1,39 @@
 from django.contrib import admin
-from .models import EmployeeProfile, Attendance
+from .models import Attendance, AttendanceEvent, DepartmentDailySummary, EmployeeProfile, FaceTemplate, Kiosk, MonthlyAttendanceSummary, ReportJob
 
 @admin.register(EmployeeProfile)
 class EmployeeProfileAdmin(admin.ModelAdmin):
-    list_display = ('employee_id', 'user', 'department')
+    list_display = ('employee_id', 'user', 'department', 'site')
+    list_filter = ('site',)
+
+@admin.register(Kiosk)
+class KioskAdmin(admin.ModelAdmin):
+    list_display = ('kiosk_id', 'name', 'site', 'fallback_to_global')
+
+@admin.register(FaceTemplate)
+class FaceTemplateAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'created_at')
 
 @admin.register(Attendance)
 class AttendanceAdmin(admin.ModelAdmin):
-    list_display = ('employee', 'date', 'check_in_time', 'status')
+    list_display = ('employee', 'date', 'check_in_time', 'check_out_time', 'status')
+    ordering = ('-date',)
+
+@admin.register(AttendanceEvent)
+class AttendanceEventAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'timestamp', 'kind', 'source')
+    list_filter = ('kind',)
+    ordering = ('-timestamp',)
+
+@admin.register(MonthlyAttendanceSummary)
+class MonthlyAttendanceSummaryAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'month', 'present_days')
+
+@admin.register(DepartmentDailySummary)
+class DepartmentDailySummaryAdmin(admin.ModelAdmin):
+    list_display = ('department', 'date', 'present_count')
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'department', 'start_date', 'end_date', 'status', 'created_at', 'finished_at')
+    list_filter = ('status',)
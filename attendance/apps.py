@@ -2,3 +2,9 @@ from django.apps import AppConfig
 
 class AttendanceConfig(AppConfig):
     name = 'attendance'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import warmup
+
+        warmup.start_if_configured()
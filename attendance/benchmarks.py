@@ -0,0 +1,867 @@
+'''Micro-benchmarks for the attendance app, run with ``manage.py benchmark``.
+
+Each scenario is a function registered with ``@scenario(name)`` that takes
+the command options and returns a list of result dicts.  Everything uses
+synthetic data so the suite runs offline.  ``--json results.json`` saves a
+run and ``--compare results.json`` reports the cases that got slower, or
+run more queries, since then.
+'''
+import asyncio
+import base64
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from . import faces
+from .coalesce import MatchCoalescer
+from .encoding import ENCODING_SIZE, pack_encoding, unpack_encoding
+from .gallery import FaceGallery
+from .inference import get_detection_profile
+from . import summaries
+from .matching import BruteForceMatcher, IVFMatcher
+
+SCENARIOS = {}
+
+
+class SkipScenario(Exception):
+    'Raised by a scenario that cannot run in this environment.'
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def best_of(func, repeat=3):
+    'Best wall-clock time of ``repeat`` calls to ``func``, in seconds.'
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+@contextmanager
+def benchmark_database(on_disk=False):
+    '''Run the block against a throwaway test database (like the test runner does).
+
+    With ``on_disk`` an SQLite test database is a temporary file instead of
+    shared-cache memory, which does not isolate concurrent writers.  The
+    test environment is set up too, so the test client's ``testserver``
+    host is allowed whatever ``ALLOWED_HOSTS`` says.
+    '''
+    from django.conf import settings
+    from django.db import connections
+    from django.test.utils import (setup_databases, setup_test_environment, teardown_databases,
+                                   teardown_test_environment)
+
+    test_settings = connections['default'].settings_dict.setdefault('TEST', {})
+    old_name = test_settings.get('NAME')
+    with tempfile.TemporaryDirectory() as directory:
+        if on_disk and connections['default'].vendor == 'sqlite' and not old_name:
+            test_settings['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        # keep DEBUG as configured: scenarios read the query log
+        setup_test_environment(debug=settings.DEBUG)
+        try:
+            old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+            try:
+                yield
+            finally:
+                teardown_databases(old_config, verbosity=0)
+        finally:
+            teardown_test_environment()
+            test_settings['NAME'] = old_name
+
+
+def populate_profiles(count, departments=20, encodings=None, start=0):
+    '''Create ``count`` synthetic users and profiles numbered from ``start``; returns their pks.
+
+    ``encodings`` (one row per profile) are stored as their face encodings.
+    '''
+    from django.contrib.auth.models import User
+
+    from .models import EmployeeProfile
+
+    last_user = User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    last_profile = EmployeeProfile.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    User.objects.bulk_create([User(username=f'bench{i}', first_name=f'First{i}', last_name=f'Last{i}')
+                              for i in range(start, start + count)], batch_size=5000)
+    users = User.objects.filter(pk__gt=last_user).order_by('pk').values_list('pk', flat=True)
+    EmployeeProfile.objects.bulk_create([
+        EmployeeProfile(user_id=user_id, employee_id=f'B{i:06d}', department=f'Dept {i % departments}',
+                        face_encoding=pack_encoding(encodings[i - start]) if encodings is not None else None)
+        for i, user_id in enumerate(users, start)
+    ], batch_size=5000)
+    return list(EmployeeProfile.objects.filter(pk__gt=last_profile).order_by('pk').values_list('pk', flat=True))
+
+
+def populate_attendance(employee_count, days, departments=20, present_ratio=0.9, seed=0):
+    '''Create synthetic users, profiles and attendance rows; returns the list of dates.'''
+    from .models import Attendance
+
+    rng = np.random.default_rng(seed)
+    employee_ids = populate_profiles(employee_count, departments)
+
+    today = date.today()
+    dates = [today - timedelta(days=i) for i in range(days)]
+    batch = []
+    for day in dates:
+        for pk in np.array(employee_ids)[rng.random(len(employee_ids)) < present_ratio]:
+            batch.append(Attendance(employee_id=int(pk), date=day, status='Present'))
+        if len(batch) >= 50000:
+            Attendance.objects.bulk_create(batch, batch_size=10000)
+            batch = []
+    Attendance.objects.bulk_create(batch, batch_size=10000)
+    return dates
+
+
+def percentiles(latencies):
+    latencies = np.asarray(latencies)
+    return {'p50_ms': float(np.percentile(latencies, 50) * 1000),
+            'p99_ms': float(np.percentile(latencies, 99) * 1000)}
+
+
+def synthetic_gallery(size):
+    gallery = FaceGallery(matcher=BruteForceMatcher())
+    gallery.load_arrays(np.arange(size), synthetic_encodings(size))
+    return gallery
+
+
+def synthetic_image(width=640, height=480, seed=0):
+    '''A webcam-like RGB frame: smooth gradients plus sensor noise.'''
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 / width, y * 255 / height, (x + y) * 127 / (width + height)], axis=-1)
+    noise = rng.normal(0, 6, size=base.shape)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def encode_image_bytes(pixels, format, **params):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format, **params)
+    return buffer.getvalue()
+
+
+def synthetic_encodings(count, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(0, 0.1, size=(count, ENCODING_SIZE)).astype(np.float32)
+    return vectors
+
+
+class JSONGallery(FaceGallery):
+    '''``FaceGallery.reload`` as it was with encodings stored as JSON text, for comparison.'''
+
+    def reload(self):
+        from .models import EmployeeProfile
+
+        rows = EmployeeProfile.objects.exclude(face_encoding__isnull=True).values_list('pk', 'face_encoding')
+        ids = []
+        vectors = []
+        for pk, raw in rows.iterator():
+            ids.append(pk)
+            vectors.append(np.asarray(json.loads(bytes(raw)), dtype=np.float32))
+        self.load_arrays(ids, vectors)
+
+
+@scenario('encoding_storage')
+def encoding_storage(options):
+    '''Gallery reload from the database with encodings stored as JSON text vs packed binary.'''
+    from django.db import connection
+
+    from .models import EmployeeProfile
+
+    results = []
+    for name, gallery_class in (('json', JSONGallery), ('binary', FaceGallery)):
+        with benchmark_database():
+            enrolled = 0
+            for size in options['sizes']:
+                vectors = synthetic_encodings(size)
+                pks = populate_profiles(size - enrolled, encodings=vectors[enrolled:], start=enrolled)
+                if name == 'json':
+                    with connection.cursor() as cursor:
+                        cursor.executemany(
+                            f'UPDATE {EmployeeProfile._meta.db_table} SET face_encoding = %s WHERE id = %s',
+                            [(json.dumps(vector.tolist()).encode(), pk) for pk, vector in zip(pks, vectors[enrolled:])])
+                enrolled = size
+                sample = list(EmployeeProfile.objects.values_list('face_encoding', flat=True)[:100])
+
+                def reload():
+                    gallery_class(matcher=BruteForceMatcher(), rerank=0).reload()
+
+                results.append({
+                    'case': f'{name} x {size}',
+                    'seconds': best_of(reload, options['repeat']),
+                    'bytes_per_row': sum(len(raw) for raw in sample) / len(sample),
+                })
+    return results
+
+
+@scenario('matching')
+def matching(options):
+    'Per-query latency and recall of the exact and IVF matchers.'
+    results = []
+    rng = np.random.default_rng(1)
+    for size in options['sizes']:
+        matrix = synthetic_encodings(size)
+        # queries are noisy copies of enrolled faces, like a new capture of a known person
+        targets = rng.choice(size, 200)
+        queries = matrix[targets] + rng.normal(0, 0.02, size=(len(targets), ENCODING_SIZE)).astype(np.float32)
+        for matcher in (BruteForceMatcher(), IVFMatcher(min_size=0)):
+            matcher.rebuild(matrix)
+
+            def search():
+                return [matcher.search(matrix, query[None, :])[0][0, 0] for query in queries]
+
+            seconds = best_of(search, options['repeat'])
+            recall = float(np.mean(np.array(search()) == targets))
+            results.append({
+                'case': f'{type(matcher).__name__} x {size}',
+                'seconds': seconds / len(queries),
+                'recall': recall,
+            })
+    return results
+
+
+@scenario('coalescing')
+def coalescing(options):
+    '''Latency of a burst of concurrent gallery lookups alone: one search per
+    request on a thread pool (the WSGI path) vs. coalesced micro-batches (the
+    async path).  ``recognize_concurrency`` compares the two views end to end.'''
+    results = []
+    concurrency = options['concurrency']
+    for size in options['sizes']:
+        gallery = synthetic_gallery(size)
+        queries = synthetic_encodings(concurrency, seed=2)
+
+        def threaded():
+            def lookup(query):
+                gallery.match(query)
+                return time.perf_counter()
+
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                submitted = time.perf_counter()
+                finished = list(pool.map(lookup, queries))
+            return [end - submitted for end in finished]
+
+        async def coalesced():
+            coalescer = MatchCoalescer(gallery=gallery)
+
+            async def lookup(query):
+                await coalescer.match(query)
+                return time.perf_counter()
+
+            submitted = time.perf_counter()
+            finished = await asyncio.gather(*(lookup(query) for query in queries))
+            return [end - submitted for end in finished]
+
+        for name, run in (('threaded', threaded), ('coalesced', lambda: asyncio.run(coalesced()))):
+            latencies = run()
+            results.append({'case': f'{name} x {size}', 'seconds': max(latencies),
+                            'concurrency': concurrency, **percentiles(latencies)})
+    return results
+
+
+@scenario('upload_formats')
+def upload_formats(options):
+    '''Bytes on the wire and server-side decode time per upload format.'''
+    pixels = synthetic_image()
+
+    def decode(image_bytes):
+        return np.asarray(Image.open(io.BytesIO(image_bytes)).convert('RGB'))
+
+    png = encode_image_bytes(pixels, 'PNG')
+    json_body = json.dumps({'image': 'data:image/png;base64,' + base64.b64encode(png).decode()}).encode()
+
+    def decode_json():
+        data_url = json.loads(json_body.decode('utf-8'))['image']
+        return decode(base64.b64decode(data_url.split(',', 1)[1]))
+
+    bodies = {
+        'json png data url': (json_body, decode_json),
+        'raw png': (png, lambda: decode(png)),
+    }
+    for format, params in (('JPEG', {'quality': 85}), ('WEBP', {'quality': 80})):
+        try:
+            body = encode_image_bytes(pixels, format, **params)
+        except (KeyError, OSError):
+            continue  # Pillow built without this codec
+        bodies[f'raw {format.lower()}'] = (body, lambda body=body: decode(body))
+
+    return [{'case': name, 'seconds': best_of(func, options['repeat']), 'bytes': len(body)}
+            for name, (body, func) in bodies.items()]
+
+
+DETECTION_VARIANTS = {
+    'hog scale 1': {},
+    'hog scale 0.5': {'SCALE': 0.5},
+    'hog scale 0.5 upsample 0': {'SCALE': 0.5, 'UPSAMPLE': 0},
+    'hog scale 0.25 upsample 2': {'SCALE': 0.25, 'UPSAMPLE': 2},
+    'cnn scale 0.5': {'SCALE': 0.5, 'MODEL': 'cnn'},
+    'hog jitters 5': {'NUM_JITTERS': 5},
+}
+
+
+def labelled_images(directory):
+    '''``{label: [image bytes, ...]}`` from a directory with one sub-directory per person.'''
+    images = {}
+    for person in sorted(Path(directory).iterdir()):
+        if person.is_dir():
+            files = sorted(f for f in person.iterdir() if f.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp'))
+            if files:
+                images[person.name] = [f.read_bytes() for f in files]
+    return images
+
+
+@scenario('detection_profiles')
+def detection_profiles(options):
+    '''Encoding latency vs. match accuracy per detection profile on a labelled image set.
+
+    The first image of each person is enrolled, the rest are recognized
+    against those enrollments with FACE_MATCH_TOLERANCE.
+    '''
+    from django.conf import settings
+
+    try:
+        import face_recognition  # noqa: F401
+    except ImportError:
+        raise SkipScenario('face_recognition is not installed')
+    if not options.get('images'):
+        raise SkipScenario('pass --images DIR (one sub-directory of photos per person)')
+    images = labelled_images(options['images'])
+    if not images:
+        raise SkipScenario(f'no labelled images under {options["images"]}')
+
+    profiles = {f'settings {name}': get_detection_profile(name)
+                for name in getattr(settings, 'FACE_DETECTION_PROFILES', {})}
+    profiles.update({name: {**faces.DEFAULT_PROFILE, **variant} for name, variant in DETECTION_VARIANTS.items()})
+
+    results = []
+    for name, profile in profiles.items():
+        latencies = []
+        encoded = {}
+        for label, blobs in images.items():
+            encoded[label] = []
+            for blob in blobs:
+                start = time.perf_counter()
+                found = faces.encode_image(blob, None, profile)
+                latencies.append(time.perf_counter() - start)
+                encoded[label].append(found[0] if found else None)
+
+        enrolled = [(label, vectors[0]) for label, vectors in encoded.items() if vectors[0] is not None]
+        gallery = np.array([vector for _, vector in enrolled]).reshape(-1, 128)
+        probes = [(label, vector) for label, vectors in encoded.items() for vector in vectors[1:]]
+        correct = wrong = missed = 0
+        for label, vector in probes:
+            if vector is None or not len(gallery):
+                missed += 1
+                continue
+            distances = np.linalg.norm(gallery - vector, axis=1)
+            best = int(distances.argmin())
+            if distances[best] > settings.FACE_MATCH_TOLERANCE:
+                missed += 1
+            elif enrolled[best][0] == label:
+                correct += 1
+            else:
+                wrong += 1
+
+        total = max(len(probes), 1)
+        results.append({
+            'case': name,
+            'seconds': float(np.mean(latencies)),
+            **percentiles(latencies),
+            'accuracy': correct / total,
+            'false_accept': wrong / total,
+            'no_face_or_reject': missed / total,
+        })
+    return results
+
+
+@scenario('summaries')
+def summary_tables(options):
+    '''Raw Attendance scans vs. summary table lookups at ``--rows`` attendance rows.'''
+    from django.db.models import Count
+
+    from .models import Attendance, EmployeeProfile, MonthlyAttendanceSummary
+
+    employee_count = 1000
+    days = max(1, options['rows'] // int(employee_count * 0.9))
+    with benchmark_database():
+        dates = populate_attendance(employee_count, days)
+        rows = Attendance.objects.count()
+        rebuild_seconds = best_of(summaries.rebuild, 1)
+
+        employee = EmployeeProfile.objects.order_by('pk').first()
+        day = dates[len(dates) // 2]
+        month = day.replace(day=1)
+        month_range = (month, summaries._month_end(month))
+
+        cases = {
+            'employee month (scan)': lambda: Attendance.objects.filter(employee=employee, date__range=month_range).count(),
+            'employee month (summary)': lambda: summaries.monthly_present_days(employee, month),
+            'department headcount (scan)': lambda: dict(Attendance.objects.filter(date=day).order_by()
+                                                        .values_list('employee__department').annotate(Count('id'))),
+            'department headcount (summary)': lambda: summaries.department_headcount(day),
+            'all employees month (scan)': lambda: list(Attendance.objects.filter(date__range=month_range).order_by()
+                                                       .values_list('employee_id').annotate(Count('id'))),
+            'all employees month (summary)': lambda: list(MonthlyAttendanceSummary.objects.filter(month=month)
+                                                          .values_list('employee_id', 'present_days')),
+        }
+        results = [{'case': 'rebuild summaries', 'seconds': rebuild_seconds, 'rows': rows}]
+        for name, query in cases.items():
+            results.append({'case': name, 'seconds': best_of(query, options['repeat']), 'rows': rows})
+    return results
+
+
+@scenario('marking_concurrency')
+def marking_concurrency(options):
+    '''Many threads marking the same employees at once; fails if any row or count is duplicated or lost.'''
+    from django.db import close_old_connections, connection
+    from django.db.models import Sum
+
+    from . import events
+    from .marking import mark_present
+    from .models import Attendance, AttendanceEvent, DepartmentDailySummary, EmployeeProfile, MonthlyAttendanceSummary
+
+    threads = options['concurrency']
+    posts = threads * 5
+    rng = np.random.default_rng(0)
+    with benchmark_database(on_disk=True):
+        populate_attendance(200, 0)
+        employee_ids = list(EmployeeProfile.objects.values_list('pk', flat=True))
+        # every post sees 1-4 people from a small group, so most posts collide
+        batches = [[int(pk) for pk in rng.choice(employee_ids[:20], rng.integers(1, 5), replace=False)]
+                   for _ in range(posts)]
+        start_barrier = threading.Barrier(threads)
+
+        def post(batch_index):
+            if batch_index < threads:
+                start_barrier.wait()
+            try:
+                return mark_present(batches[batch_index], source=f'kiosk-{batch_index % 8}')
+            finally:
+                close_old_connections()
+
+        def run():
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                return list(pool.map(post, range(posts)))
+
+        start = time.perf_counter()
+        created = run()
+        seconds = time.perf_counter() - start
+        events.flush()
+
+        expected = {pk for batch in batches for pk in batch}
+        rows = Attendance.objects.count()
+        checked_in = sum(len(pks) for pks in created)
+        monthly = MonthlyAttendanceSummary.objects.aggregate(total=Sum('present_days'))['total'] or 0
+        daily = DepartmentDailySummary.objects.aggregate(total=Sum('present_count'))['total'] or 0
+        event_count = AttendanceEvent.objects.count()
+        problems = []
+        if rows != len(expected) or checked_in != len(expected):
+            problems.append(f'{rows} rows and {checked_in} check-ins for {len(expected)} employees')
+        if monthly != len(expected) or daily != len(expected):
+            problems.append(f'summaries count {monthly} (monthly) / {daily} (daily) for {len(expected)} employees')
+        if event_count != sum(len(batch) for batch in batches):
+            problems.append(f'{event_count} events for {sum(len(batch) for batch in batches)} sightings')
+        if problems:
+            raise AssertionError('; '.join(problems))
+        return [{'case': f'{posts} posts, {threads} threads', 'seconds': seconds, 'backend': connection.vendor,
+                 'rows': rows, 'events': event_count, 'checked_out': Attendance.objects.filter(check_out_time__isnull=False).count()}]
+
+
+@scenario('recent_matches')
+def recent_matches(options):
+    '''Queues of people sending several captures each: how many skip the gallery, and whether any answer differs.'''
+    from .recent import RecentMatches
+
+    tolerance = 0.5
+    rng = np.random.default_rng(0)
+    results = []
+    for size in options['sizes']:
+        gallery = synthetic_gallery(size)
+        recent = RecentMatches(ttl=10, max_entries=256, radius=0.2)
+        people = rng.choice(size, 200, replace=False)
+        captures = [(f'kiosk-{i % 4}', gallery.encodings[person] + rng.normal(0, 0.01, ENCODING_SIZE).astype(np.float32))
+                    for i, person in enumerate(people) for _ in range(5)]
+
+        wrong = 0
+        start = time.perf_counter()
+        for kiosk, encoding in captures:
+            entry = recent.lookup(kiosk, encoding)
+            if entry is not None:
+                continue
+            match = gallery.match(encoding)
+            if match and match.distance <= tolerance:
+                recent.remember(kiosk, encoding, match, match.employee_id, '', tolerance)
+        seconds = time.perf_counter() - start
+
+        # replay against the full search to check every remembered answer
+        recent = RecentMatches(ttl=10, max_entries=256, radius=0.2)
+        for kiosk, encoding in captures:
+            entry = recent.lookup(kiosk, encoding)
+            match = gallery.match(encoding)
+            if entry is not None:
+                wrong += match is None or entry.employee != match.employee_id
+            elif match and match.distance <= tolerance:
+                recent.remember(kiosk, encoding, match, match.employee_id, '', tolerance)
+        if wrong:
+            raise AssertionError(f'{wrong} captures answered with a different employee than the gallery')
+
+        full_search = best_of(lambda: [gallery.match(encoding) for _, encoding in captures], 1)
+        results.append({'case': f'{len(captures)} captures, {size} enrolled', 'seconds': seconds,
+                        'hit_rate': recent.hits / len(captures), 'full_search_ms': full_search * 1000, 'wrong': wrong})
+    return results
+
+
+@scenario('startup')
+def startup(options):
+    '''Process start-up time: ``manage.py check`` and imports, with and without face_recognition.
+
+    Each case is a fresh interpreter, so it includes Python and Django
+    start-up.  ``FACE_WARMUP=1`` must not slow management commands down; the
+    import cases show what a web worker pays before (or, with warm-up, instead
+    of) its first recognition.
+    '''
+    import subprocess
+    import sys
+
+    from django.conf import settings
+
+    manage = str(Path(settings.BASE_DIR) / 'manage.py')
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'attendance_system.settings.dev')}
+    setup = 'import django; django.setup(); import attendance.views'
+    cases = [
+        ('manage.py check', [manage, 'check'], {'FACE_WARMUP': ''}),
+        ('manage.py check, FACE_WARMUP=1', [manage, 'check'], {'FACE_WARMUP': '1'}),
+        ('django.setup + views', ['-c', setup], {'FACE_WARMUP': ''}),
+    ]
+    if faces.available():
+        cases += [
+            ('django.setup + views + face_recognition', ['-c', f'{setup}; import face_recognition'], {'FACE_WARMUP': ''}),
+            ('+ warm-up (models, gallery)', ['-c', f'{setup}; from attendance.warmup import get_warmup; '
+                                             f'w = get_warmup(); w.start(); w.wait(); assert w.ready, w.error'],
+             {'FACE_WARMUP': ''}),
+        ]
+
+    results = []
+    for name, args, extra_env in cases:
+        def run():
+            subprocess.run([sys.executable, *args], env={**env, **extra_env}, cwd=settings.BASE_DIR,
+                           check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        results.append({'case': name, 'seconds': best_of(run, options['repeat'])})
+    return results
+
+
+def staff_client(employee):
+    '''A test client logged in as ``employee``'s user, made staff.'''
+    from django.test import Client
+
+    user = employee.user
+    user.is_staff = True
+    user.save(update_fields=['is_staff'])
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def fetch(client, url):
+    'GET ``url`` and read the whole body, streamed or not; returns the body size.'
+    response = client.get(url)
+    body = b''.join(response.streaming_content) if response.streaming else response.content
+    if response.status_code != 200:
+        raise AssertionError(f'{url} returned {response.status_code}: {body[:200]}')
+    return len(body)
+
+
+@scenario('gallery_build')
+def gallery_build(options):
+    '''Gallery load from the database, and from arrays already in memory, at 1k/10k/100k profiles.'''
+    from .gallery import FaceGallery
+
+    results = []
+    with benchmark_database():
+        enrolled = 0
+        for size in options['gallery_sizes']:
+            vectors = synthetic_encodings(size)
+            # grow the same database from one size to the next
+            populate_profiles(size - enrolled, encodings=vectors[enrolled:], start=enrolled)
+            enrolled = size
+
+            def reload():
+                FaceGallery(matcher=BruteForceMatcher(), rerank=0).reload()
+
+            def load_arrays():
+                FaceGallery(matcher=BruteForceMatcher(), rerank=0).load_arrays(np.arange(size), vectors)
+
+            results.append({'case': f'reload from database x {size}', 'seconds': best_of(reload, options['repeat']),
+                            'profiles': size})
+            results.append({'case': f'load_arrays x {size}', 'seconds': best_of(load_arrays, options['repeat']),
+                            'profiles': size})
+    return results
+
+
+@scenario('site_shards')
+def site_shards(options):
+    '''Matching against a 20-site company's global gallery vs. one site's shard, with and without fallback.'''
+    from . import sites
+    from .models import EmployeeProfile
+
+    site_count, queries = 20, 200
+    results = []
+    with benchmark_database():
+        size = options['gallery_sizes'][0]
+        vectors = synthetic_encodings(size)
+        pks = populate_profiles(size, encodings=vectors)
+        for index in range(site_count):
+            EmployeeProfile.objects.filter(pk__in=pks[index::site_count]).update(site=f'Site {index}')
+        everyone = FaceGallery(matcher=BruteForceMatcher(), rerank=0)
+        shard = FaceGallery(matcher=BruteForceMatcher(), rerank=0, site='Site 0')
+        everyone.reload()
+        shard.reload()
+        rng = np.random.default_rng(1)
+        # captures of site 0 staff, and of people from other sites (each a fallback search)
+        local = vectors[0::site_count][:queries] + rng.normal(0, 0.01, (min(queries, len(shard)), ENCODING_SIZE))
+        visitors = vectors[1::site_count][:queries] + rng.normal(0, 0.01, (min(queries, len(shard)), ENCODING_SIZE))
+        cases = {
+            'global gallery': ([everyone], local),
+            'site shard': ([shard], local),
+            'shard, visitor found in global': ([shard, everyone], visitors),
+        }
+        for name, (galleries, probes) in cases.items():
+            def run():
+                for vector in probes:
+                    sites.match(galleries, vector)
+
+            seconds = best_of(run, options['repeat']) / len(probes)
+            results.append({'case': name, 'seconds': seconds, 'searched': len(galleries[0]), 'profiles': size})
+    return results
+
+
+def recognizable_frame():
+    '''``(JPEG bytes, X-Face-Box value, encoding)`` of a synthetic frame the encoder accepts.
+
+    The box hint lets the encoder run without needing a real face.
+    '''
+    if not faces.available():
+        raise SkipScenario('face_recognition is not installed')
+    image = encode_image_bytes(synthetic_image(), 'JPEG', quality=85)
+    box = (90, 420, 390, 220)
+    found = faces.encode_image(image, box, get_detection_profile('recognition'))
+    if not found:
+        raise SkipScenario('the encoder returned nothing for the synthetic frame')
+    return image, ','.join(map(str, box)), found[0]
+
+
+def enroll_frame(size, encoding):
+    '''Enroll ``size`` synthetic profiles, the first with ``encoding``, and load the gallery.'''
+    from .gallery import get_gallery
+    from .models import EmployeeProfile
+
+    populate_profiles(size, encodings=synthetic_encodings(size))
+    employee = EmployeeProfile.objects.order_by('pk').first()
+    employee.face_encoding = pack_encoding(encoding)
+    employee.save()
+    get_gallery().reload()
+
+
+@contextmanager
+def inference_service(**config):
+    '''Serve ``get_inference()`` from a service built with ``config`` inside the block.'''
+    from . import inference
+
+    service = inference.InferenceService(**config)
+    with inference._service_lock:
+        previous, inference._service = inference._service, service
+    try:
+        yield service
+    finally:
+        with inference._service_lock:
+            inference._service = previous
+        service.shutdown()
+
+
+@scenario('recognize')
+def recognize(options):
+    '''``recognize_view`` end to end through the test client, with a synthetic frame and gallery.
+
+    The frame is sent with an ``X-Face-Box`` hint, so the encoder runs
+    without needing a real face; one profile is enrolled with that
+    encoding so the request goes all the way to the attendance write.
+    '''
+    from django.test import Client
+
+    from . import events
+    from .recent import get_recent_matches
+
+    image, face_box, encoding = recognizable_frame()
+    calls = max(options['repeat'] * 10, 20)
+    results = []
+    # on disk: the event buffer writes from its own thread
+    with benchmark_database(on_disk=True):
+        size = options['gallery_sizes'][0]
+        enroll_frame(size, encoding)
+        recent = get_recent_matches()
+        client = Client()
+
+        def post(headers, forget=True):
+            def call():
+                if forget:
+                    recent.clear()
+                response = client.post('/recognize/', image, content_type='image/jpeg', headers=headers)
+                if response.status_code not in (200, 400, 404):
+                    raise AssertionError(f'/recognize/ returned {response.status_code}: {response.content[:200]}')
+                return response.status_code
+            return call
+
+        cases = {
+            'matched (face box hint)': post({'X-Face-Box': face_box, 'X-Kiosk-Id': 'bench'}),
+            'repeat capture (recent match)': post({'X-Face-Box': face_box, 'X-Kiosk-Id': 'bench'}, forget=False),
+            'full-frame detection': post({'X-Kiosk-Id': 'bench'}),
+        }
+        for name, call in cases.items():
+            call()
+            latencies = []
+            for _ in range(calls):
+                start = time.perf_counter()
+                status = call()
+                latencies.append(time.perf_counter() - start)
+            results.append({'case': name, 'seconds': float(np.median(latencies)), **percentiles(latencies),
+                            'status': status, 'gallery': size})
+        events.flush()
+    return results
+
+
+@scenario('recognize_concurrency')
+def recognize_concurrency(options):
+    '''``--concurrency`` kiosks posting at once: ``recognize_view`` on 8 WSGI threads vs. ``recognize_async_view``.
+
+    Every request comes from its own kiosk, so none is answered from the
+    recent matches.  Latency runs from the moment all requests are sent to
+    each response.  The inference queue is as long as the burst, so no
+    request is turned away.
+    '''
+    from django.conf import settings
+    from django.test import AsyncClient, Client
+
+    from . import events
+
+    image, face_box, encoding = recognizable_frame()
+    concurrency = options['concurrency']
+    workers = getattr(settings, 'FACE_INFERENCE', {}).get('WORKERS', 1)
+
+    def check(status, url):
+        if status != 200:
+            raise AssertionError(f'{url} returned {status}')
+
+    def wsgi():
+        client = Client()
+
+        def post(kiosk):
+            check(client.post('/recognize/', image, content_type='image/jpeg',
+                              headers={'X-Face-Box': face_box, 'X-Kiosk-Id': kiosk}).status_code, '/recognize/')
+            return time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            sent = time.perf_counter()
+            finished = list(pool.map(post, [f'wsgi-{i}' for i in range(concurrency)]))
+        return [end - sent for end in finished]
+
+    async def asgi():
+        client = AsyncClient()
+
+        async def post(kiosk):
+            response = await client.post('/recognize/async/', image, content_type='image/jpeg',
+                                         headers={'X-Face-Box': face_box, 'X-Kiosk-Id': kiosk})
+            check(response.status_code, '/recognize/async/')
+            return time.perf_counter()
+
+        sent = time.perf_counter()
+        finished = await asyncio.gather(*(post(f'async-{i}') for i in range(concurrency)))
+        return [end - sent for end in finished]
+
+    results = []
+    with benchmark_database(on_disk=True):
+        size = options['gallery_sizes'][0]
+        enroll_frame(size, encoding)
+        with inference_service(workers=workers, max_queue=concurrency, timeout=60):
+            for name, run in (('wsgi view, 8 threads', wsgi), ('async view', lambda: asyncio.run(asgi()))):
+                latencies = run()
+                results.append({'case': name, 'seconds': max(latencies), 'concurrency': concurrency,
+                                'gallery': size, **percentiles(latencies)})
+        events.flush()
+    return results
+
+
+@scenario('views')
+def views(options):
+    '''Latency and query counts of the dashboard and attendance list, with a cold and a warm cache.'''
+    from .models import EmployeeProfile
+    from .querychecks import clear_attendance_cache, count_queries
+
+    employees, days = 1000, 30
+    urls = {
+        'dashboard': '/dashboard/',
+        'attendance list, 50 per page': '/attendance-list/?per_page=50',
+        'attendance list, 500 per page (streamed)': '/attendance-list/?per_page=500',
+    }
+    results = []
+    with benchmark_database():
+        populate_attendance(employees, days)
+        summaries.rebuild()
+        client = staff_client(EmployeeProfile.objects.order_by('pk').first())
+        for name, url in urls.items():
+            def cold():
+                clear_attendance_cache()
+                fetch(client, url)
+
+            cold_queries = count_queries(cold)
+            warm_queries = count_queries(lambda: fetch(client, url))
+            size = fetch(client, url)
+            results.append({'case': f'{name}, cold', 'seconds': best_of(cold, options['repeat']),
+                            'queries': cold_queries, 'bytes': size})
+            results.append({'case': f'{name}, warm', 'seconds': best_of(lambda: fetch(client, url), options['repeat']),
+                            'queries': warm_queries, 'bytes': size})
+    return results
+
+
+@scenario('excel_export')
+def excel_export(options):
+    '''``download_attendance_excel`` for one employee over long date ranges, and the bulk export.'''
+    from .models import EmployeeProfile
+    from .querychecks import count_queries
+
+    spans = [30, 365, 1825]
+    results = []
+    with benchmark_database():
+        dates = populate_attendance(200, max(spans))
+        summaries.rebuild()
+        employee = EmployeeProfile.objects.order_by('pk').first()
+        client = staff_client(employee)
+        end = dates[0]
+        cases = {f'employee, {span} days': f'/attendance-download/?employee_id={employee.pk}'
+                                           f'&start_date={end - timedelta(days=span - 1)}&end_date={end}'
+                 for span in spans}
+        cases.update({f'bulk, 200 employees, {span} days': f'/attendance-download/bulk/?start_date='
+                                                          f'{end - timedelta(days=span - 1)}&end_date={end}'
+                      for span in (7, 31)})
+        for name, url in cases.items():
+            queries = count_queries(lambda: fetch(client, url))
+            size = fetch(client, url)
+            results.append({'case': name, 'seconds': best_of(lambda: fetch(client, url), options['repeat']),
+                            'queries': queries, 'bytes': size})
+    return results
@@ -0,0 +1,298 @@
+'''Short-burst recognition: a few small frames over one connection.
+
+Instead of one full-resolution still per attempt, the kiosk streams several
+low-resolution frames in the body of a single POST to ``recognize/burst/``.
+Each frame is a 4-byte big-endian length followed by that many bytes of
+JPEG or PNG.  The server encodes and matches the frames as they arrive and
+answers as soon as it can decide:
+
+- a frame matches an employee within ``FACE_MATCH_TOLERANCE`` and at least
+  ``MIN_MARGIN`` closer than the runner-up, and
+- with ``REQUIRE_LIVENESS``, the face has moved between two consecutive
+  frames: the mean absolute difference of their normalized 32x32 face
+  thumbnails is between ``MIN_MOTION`` and ``MAX_MOTION``.
+
+The liveness check is deliberately simple.  It rejects a re-sent image or a
+printed photo held still in front of the camera, not a video replay.  Frames
+whose matches disagree on who is in front of the camera end the burst with
+an error.
+
+Under ASGI ``BurstMiddleware`` (installed in ``attendance_system.asgi``)
+reads the body as it is received and responds before the client has sent
+every frame.  Under WSGI the server buffers the request body, so
+``recognize_burst_view`` still stops encoding at the deciding frame but
+cannot answer earlier.
+
+Configured with the ``FACE_BURST`` setting.
+'''
+import json
+import struct
+from collections import namedtuple
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import faces, sites
+from .inference import InferenceUnavailable, get_detection_profile, get_inference
+from .marking import mark_present
+from .models import EmployeeProfile
+from .recent import get_recent_matches
+
+HEADER = struct.Struct('>I')
+
+Decision = namedtuple('Decision', ['status', 'reason', 'match', 'encoding', 'employee', 'first_name', 'live', 'frames'])
+
+
+class BurstError(ValueError):
+    'The request body is not a valid frame stream.'
+
+
+def get_burst_config():
+    return {
+        'MAX_FRAMES': 8,
+        'MAX_FRAME_BYTES': 256 * 1024,
+        'MIN_MARGIN': 0.08,
+        'REQUIRE_LIVENESS': True,
+        'MIN_MOTION': 0.08,
+        'MAX_MOTION': 0.8,
+        **getattr(settings, 'FACE_BURST', {}),
+    }
+
+
+class FrameReader:
+    'Splits a length-prefixed frame stream fed in arbitrary chunks.'
+
+    def __init__(self, max_frame_bytes):
+        self.max_frame_bytes = max_frame_bytes
+        self._buffer = bytearray()
+
+    def feed(self, chunk):
+        'Complete frames in the data received so far.'
+        self._buffer += chunk
+        frames = []
+        while len(self._buffer) >= HEADER.size:
+            length, = HEADER.unpack_from(self._buffer)
+            if not 0 < length <= self.max_frame_bytes:
+                raise BurstError(f'Frames must be between 1 and {self.max_frame_bytes} bytes')
+            if len(self._buffer) < HEADER.size + length:
+                break
+            frames.append(bytes(self._buffer[HEADER.size:HEADER.size + length]))
+            del self._buffer[:HEADER.size + length]
+        return frames
+
+    def close(self):
+        if self._buffer:
+            raise BurstError('The last frame is truncated')
+
+
+def motion(previous, current):
+    'Mean absolute difference of two face thumbnails, each normalized to zero mean and unit variance.'
+    a = (previous - previous.mean()) / (previous.std() + 1e-6)
+    b = (current - current.mean()) / (current.std() + 1e-6)
+    return float(np.abs(a - b).mean())
+
+
+class BurstSession:
+    '''Decision state for one burst; fed one frame at a time by ``BurstRecognizer``.'''
+
+    def __init__(self, tolerance, max_frames=8, min_margin=0.08, require_liveness=True,
+                 min_motion=0.08, max_motion=0.8):
+        self.tolerance = tolerance
+        self.max_frames = max_frames
+        self.min_margin = min_margin
+        self.require_liveness = require_liveness
+        self.min_motion = min_motion
+        self.max_motion = max_motion
+        self.frames = 0
+        self.faces = 0
+        self.live = False
+        self.best = None
+        self.conflict = False
+        self._thumbnail = None
+
+    def add(self, encoding, thumbnail, match):
+        '''Account for one frame; returns a ``Decision`` once the burst is decided, else None.
+
+        ``encoding`` and ``thumbnail`` are None for a frame without a face.
+        '''
+        self.frames += 1
+        if encoding is not None:
+            self.faces += 1
+            if thumbnail is not None and self._thumbnail is not None:
+                if self.min_motion <= motion(self._thumbnail, thumbnail) <= self.max_motion:
+                    self.live = True
+            if match and match.distance <= self.tolerance:
+                if self.best and self.best[0].employee_id != match.employee_id:
+                    self.conflict = True
+                    return self.finish()
+                if match.margin >= self.min_margin and (not self.best or match.distance < self.best[0].distance):
+                    self.best = (match, encoding)
+        self._thumbnail = thumbnail
+        if self.best and (self.live or not self.require_liveness):
+            return self._decide('matched')
+        if self.frames >= self.max_frames:
+            return self.finish()
+        return None
+
+    def finish(self):
+        'The decision once no more frames will come.'
+        if self.conflict:
+            return self._decide('error', 'Different faces in one burst')
+        if self.best and (self.live or not self.require_liveness):
+            return self._decide('matched')
+        if self.best:
+            return self._decide('error', 'Liveness check failed, look at the camera and move slightly')
+        if self.faces:
+            return self._decide('error', 'No match found')
+        return self._decide('error', 'No face detected')
+
+    def _decide(self, status, reason=None):
+        match, encoding = self.best if status == 'matched' else (None, None)
+        return Decision(status, reason, match, encoding, None, None, self.live, self.frames)
+
+
+class BurstRecognizer:
+    '''Encodes and matches the frames of one burst as their bytes arrive.
+
+    ``feed``/``afeed`` take body chunks and return the ``Decision`` once
+    there is one (ignoring further data), ``close`` decides at the end of the
+    body.  A frame of someone a kiosk has just marked present is decided
+    straight away from ``attendance.recent``.
+    '''
+
+    def __init__(self, kiosk):
+        config = get_burst_config()
+        self.kiosk = kiosk
+        self.reader = FrameReader(config['MAX_FRAME_BYTES'])
+        self.session = BurstSession(settings.FACE_MATCH_TOLERANCE, config['MAX_FRAMES'], config['MIN_MARGIN'],
+                                    config['REQUIRE_LIVENESS'], config['MIN_MOTION'], config['MAX_MOTION'])
+        self.profile = get_detection_profile('burst')
+        self.galleries = None
+        self.recent = get_recent_matches()
+        self.decision = None
+
+    def feed(self, chunk):
+        for frame in self._frames(chunk):
+            if self.decision is not None:
+                break
+            encodings, thumbnail = get_inference().run(faces.encode_frame, frame, self.profile)
+            if self.galleries is None:
+                self.galleries = sites.galleries_for(self.kiosk)
+            match = sites.match(self.galleries, encodings[0]) if encodings and not self._recent(encodings[0]) else None
+            self._add(encodings, thumbnail, match)
+        return self.decision
+
+    async def afeed(self, chunk):
+        for frame in self._frames(chunk):
+            if self.decision is not None:
+                break
+            encodings, thumbnail = await get_inference().arun(faces.encode_frame, frame, self.profile)
+            if self.galleries is None:
+                self.galleries = await sync_to_async(sites.galleries_for)(self.kiosk)
+            match = (await sites.amatch(self.galleries, encodings[0])
+                     if encodings and not self._recent(encodings[0]) else None)
+            self._add(encodings, thumbnail, match)
+        return self.decision
+
+    def close(self):
+        if self.decision is None:
+            self.reader.close()
+            self.decision = self.session.finish()
+        return self.decision
+
+    def _frames(self, chunk):
+        if self.decision is not None:
+            return []
+        return self.reader.feed(chunk)
+
+    def _recent(self, encoding):
+        entry = self.recent.lookup(self.kiosk, encoding)
+        if entry:
+            # already marked a moment ago
+            self.decision = Decision('matched', None, None, None, entry.employee, entry.first_name,
+                                     self.session.live, self.session.frames + 1)
+        return entry
+
+    def _add(self, encodings, thumbnail, match):
+        if self.decision is None:
+            self.decision = self.session.add(encodings[0] if encodings else None, thumbnail, match)
+
+
+def complete(decision, kiosk):
+    '''Mark attendance for a matched burst; returns ``(status code, JSON payload)``.'''
+    details = {'frames': decision.frames, 'live': decision.live}
+    if decision.status != 'matched':
+        status = {'No match found': 404, 'No face detected': 400}.get(decision.reason, 403)
+        return status, {'status': 'error', 'message': decision.reason, **details}
+    if decision.match is None:
+        return 200, {'status': 'ok', 'employee': decision.employee, 'first_name': decision.first_name, **details}
+    try:
+        profile = EmployeeProfile.objects.select_related('user').get(pk=decision.match.employee_id)
+    except EmployeeProfile.DoesNotExist:
+        return 500, {'status': 'error', 'message': 'Matched profile not found', **details}
+    mark_present([profile.pk], source=kiosk)
+    get_recent_matches().remember(kiosk, decision.encoding, decision.match, profile.employee_id,
+                                  profile.user.first_name, settings.FACE_MATCH_TOLERANCE)
+    return 200, {'status': 'ok', 'employee': profile.employee_id, 'first_name': profile.user.first_name, **details}
+
+
+def _complete_request(decision, kiosk):
+    # outside Django's handler nothing else closes stale connections
+    close_old_connections()
+    try:
+        return complete(decision, kiosk)
+    finally:
+        close_old_connections()
+
+
+class BurstMiddleware:
+    '''ASGI wrapper that serves burst POSTs to ``recognize/burst/`` while the body is still arriving.
+
+    Everything else, and every request when face_recognition is not
+    installed, goes to the wrapped Django application.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+        self._path = None
+
+    def _burst_path(self):
+        if self._path is None:
+            from django.urls import reverse
+
+            self._path = reverse('recognize_burst')
+        return self._path
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http' or scope['method'] != 'POST' or scope['path'] != self._burst_path()
+                or not faces.available()):
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get('headers') or [])
+        kiosk = headers.get(b'x-kiosk-id', b'').decode('latin-1') or (scope.get('client') or [''])[0]
+        retry_after = None
+        try:
+            recognizer = BurstRecognizer(kiosk)
+            decision = None
+            while decision is None:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                decision = await recognizer.afeed(message.get('body', b''))
+                if not message.get('more_body', False):
+                    decision = recognizer.close()
+            status, payload = await sync_to_async(_complete_request)(decision, kiosk)
+        except BurstError as exc:
+            status, payload = 400, {'status': 'error', 'message': str(exc)}
+        except OSError:
+            status, payload = 400, {'status': 'error', 'message': 'Invalid image'}
+        except InferenceUnavailable as exc:
+            status, payload, retry_after = 503, {'status': 'error', 'message': str(exc)}, exc.retry_after
+
+        response_headers = [(b'content-type', b'application/json')]
+        if retry_after is not None:
+            response_headers.append((b'retry-after', str(retry_after).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': json.dumps(payload).encode()})
@@ -0,0 +1,136 @@
+'''Versioned caching for dashboard and attendance list data.
+
+Cached values are keyed by a *version* per scope (``employee:<pk>`` for one
+employee's attendance, ``profiles`` for the employee listing).  Signals and
+``mark_present`` bump the version when the underlying rows change, which
+orphans the old entries instead of having to find and delete them.
+
+The backend is the cache alias named by ``ATTENDANCE_CACHE_ALIAS`` (local
+memory by default; use a file-based or shared cache when running several
+worker processes so invalidations are seen by all of them).
+'''
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Attendance
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'ATTENDANCE_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'ATTENDANCE_CACHE_TIMEOUT', 300)
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def stats():
+    'Hit/miss counters for this process.'
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else None}
+
+
+def _version_key(scope):
+    return f'attendance:version:{scope}'
+
+
+def versions(scopes):
+    '''Current version of each scope; missing ones are started at the current time.'''
+    cache = _cache()
+    keys = {scope: _version_key(scope) for scope in scopes}
+    found = cache.get_many(keys.values())
+    result = {}
+    missing = {}
+    for scope, key in keys.items():
+        if key in found:
+            result[scope] = found[key]
+        else:
+            # a time-based start never reuses a number an evicted version already had
+            result[scope] = missing[key] = time.time_ns()
+    if missing:
+        cache.set_many(missing, timeout=None)
+    return result
+
+
+def bump(*scopes):
+    '''Invalidate everything cached under ``scopes`` once the current transaction commits.
+
+    Bumping earlier would let a concurrent reader cache the pre-commit rows
+    under the new version.
+    '''
+    transaction.on_commit(lambda: _bump_now(scopes))
+
+
+def _bump_now(scopes):
+    # each new version is a unique token rather than an increment: incr() is a
+    # read and a write on file-based caches, so two processes bumping at once
+    # could both write the same number, and a reader that saw only the first
+    # change would take the version as current
+    _cache().set_many({_version_key(scope): uuid.uuid4().hex for scope in scopes}, timeout=None)
+
+
+def invalidate_employees(employee_ids):
+    bump(*(f'employee:{pk}' for pk in employee_ids))
+
+
+def cached(key, scopes, compute):
+    'Return the cached value for ``key`` under the current ``scopes`` versions, computing it on a miss.'
+    scope_versions = versions(scopes)
+    full_key = 'attendance:' + key + ':' + ':'.join(str(scope_versions[scope]) for scope in scopes)
+    cache = _cache()
+    sentinel = object()
+    value = cache.get(full_key, sentinel)
+    if value is not sentinel:
+        _count('hits')
+        return value
+    _count('misses')
+    value = compute()
+    cache.set(full_key, value, _timeout())
+    return value
+
+
+def recent_attendance(employee_ids, dates):
+    '''``{employee_pk: {date: check_in_time}}`` over ``dates`` for each employee.
+
+    Each employee's window is cached separately under its own version, and
+    all misses are loaded with a single query.
+    '''
+    employee_ids = list(employee_ids)
+    if not employee_ids:
+        return {}
+    start, end = min(dates), max(dates)
+    scope_versions = versions([f'employee:{pk}' for pk in employee_ids])
+    keys = {pk: f'attendance:window:{pk}:{start}:{end}:{scope_versions[f"employee:{pk}"]}' for pk in employee_ids}
+
+    cache = _cache()
+    found = cache.get_many(keys.values())
+    windows = {pk: found[key] for pk, key in keys.items() if key in found}
+    missing = [pk for pk in employee_ids if pk not in windows]
+    _count('hits', len(windows))
+    _count('misses', len(missing))
+
+    if missing:
+        loaded = {pk: {} for pk in missing}
+        records = (Attendance.objects
+                   .filter(employee_id__in=missing, date__range=(start, end))
+                   .values_list('employee_id', 'date', 'check_in_time'))
+        for pk, record_date, check_in_time in records:
+            loaded[pk][record_date] = check_in_time
+        cache.set_many({keys[pk]: window for pk, window in loaded.items()}, _timeout())
+        windows.update(loaded)
+    return windows
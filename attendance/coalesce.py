@@ -0,0 +1,73 @@
+'''Micro-batching of gallery lookups for the async recognition view.
+
+Concurrent requests on the same event loop hand their encodings to a
+``MatchCoalescer``; everything that arrives within ``window`` seconds (or
+until ``max_batch`` encodings are waiting) is matched with a single
+``FaceGallery.match_many`` call in a worker thread.
+'''
+import asyncio
+import weakref
+
+import numpy as np
+from django.conf import settings
+
+from .gallery import get_gallery
+
+
+class MatchCoalescer:
+
+    def __init__(self, gallery=None, window=0.005, max_batch=64):
+        self.gallery = gallery if gallery is not None else get_gallery()
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+
+    async def match(self, encoding):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((encoding, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        loop = asyncio.get_running_loop()
+        # match_many may load the gallery through the ORM, so keep it off the loop thread
+        job = loop.run_in_executor(None, self.gallery.match_many, np.stack([encoding for encoding, _ in batch]))
+
+        def resolve(job):
+            for index, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if job.exception() is not None:
+                    future.set_exception(job.exception())
+                else:
+                    future.set_result(job.result()[index])
+
+        job.add_done_callback(resolve)
+
+
+_coalescers = weakref.WeakKeyDictionary()
+
+
+def get_coalescer(gallery=None):
+    'The coalescer for ``gallery`` (default: the global gallery) on the running event loop.'
+    loop = asyncio.get_running_loop()
+    gallery = gallery if gallery is not None else get_gallery()
+    coalescers = _coalescers.setdefault(loop, {})
+    coalescer = coalescers.get(gallery)
+    if coalescer is None:
+        config = getattr(settings, 'FACE_MATCH_COALESCING', {})
+        coalescer = MatchCoalescer(gallery, window=config.get('WINDOW', 0.005), max_batch=config.get('MAX_BATCH', 64))
+        coalescers[gallery] = coalescer
+    return coalescer
@@ -0,0 +1,37 @@
+'''Compact binary storage for face encodings.
+
+An encoding is stored as a 4 byte header followed by the raw vector:
+
+    b'FE' | version (1 byte) | dtype code (1 byte) | 128 x little-endian float32
+
+which is 516 bytes per profile instead of ~2.5 KB of JSON text, and decodes
+with a single ``np.frombuffer`` call.
+'''
+import numpy as np
+
+ENCODING_SIZE = 128
+MAGIC = b'FE'
+VERSION = 1
+DTYPES = {
+    ord('f'): np.dtype('<f4'),
+    ord('d'): np.dtype('<f8'),
+}
+HEADER_SIZE = 4
+
+
+def pack_encoding(vector):
+    vector = np.asarray(vector, dtype='<f4').reshape(ENCODING_SIZE)
+    return MAGIC + bytes((VERSION, ord('f'))) + vector.tobytes()
+
+
+def unpack_encoding(raw):
+    'Return the stored vector as float32, or None if ``raw`` is not a valid encoding.'
+    if not raw:
+        return None
+    raw = bytes(raw)
+    if raw[:2] != MAGIC or len(raw) < HEADER_SIZE or raw[2] != VERSION:
+        return None
+    dtype = DTYPES.get(raw[3])
+    if dtype is None or len(raw) - HEADER_SIZE != ENCODING_SIZE * dtype.itemsize:
+        return None
+    return np.frombuffer(raw, dtype=dtype, offset=HEADER_SIZE).astype(np.float32)
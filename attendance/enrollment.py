@@ -0,0 +1,64 @@
+'''Multi-sample face enrollment.
+
+Every accepted enrollment capture is kept as a ``FaceTemplate`` (the newest
+``MAX_PER_EMPLOYEE`` per employee), and ``EmployeeProfile.face_encoding``
+holds their centroid.  The gallery searches the centroids and re-ranks the
+closest candidates by their individual templates (see ``FaceGallery``), so
+a capture with glasses or in different light only has to resemble one of
+the samples.
+
+Configured with the ``FACE_TEMPLATES`` setting.
+'''
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+
+from .encoding import pack_encoding, unpack_encoding
+from .models import FaceTemplate
+
+
+def max_templates():
+    return getattr(settings, 'FACE_TEMPLATES', {}).get('MAX_PER_EMPLOYEE', 5)
+
+
+def centroids(samples):
+    '''Centroid encoding for each ``(profile, new_encodings)`` in ``samples``.
+
+    Averages the new encodings with the profile's newest stored templates,
+    ``MAX_PER_EMPLOYEE`` vectors in all, which is what the profile keeps
+    once ``store_templates`` has run.
+    '''
+    limit = max_templates()
+    stored = defaultdict(list)
+    saved = [profile.pk for profile, _ in samples if profile.pk]
+    if saved:
+        rows = (FaceTemplate.objects
+                .filter(employee_id__in=saved)
+                .order_by('-created_at', '-pk')
+                .values_list('employee_id', 'encoding'))
+        for pk, raw in rows:
+            vector = unpack_encoding(raw)
+            if vector is not None:
+                stored[pk].append(vector)
+    return [np.mean((list(encodings) + stored[profile.pk])[:limit], axis=0).astype(np.float32)
+            for profile, encodings in samples]
+
+
+def store_templates(samples):
+    '''Save ``(profile, new_encodings)`` as templates and drop each profile's oldest beyond ``MAX_PER_EMPLOYEE``.'''
+    FaceTemplate.objects.bulk_create([FaceTemplate(employee=profile, encoding=pack_encoding(encoding))
+                                      for profile, encodings in samples for encoding in encodings])
+    limit = max_templates()
+    kept = defaultdict(int)
+    expired = []
+    rows = (FaceTemplate.objects
+            .filter(employee_id__in=[profile.pk for profile, _ in samples])
+            .order_by('employee_id', '-created_at', '-pk')
+            .values_list('employee_id', 'pk'))
+    for employee_id, pk in rows:
+        kept[employee_id] += 1
+        if kept[employee_id] > limit:
+            expired.append(pk)
+    if expired:
+        FaceTemplate.objects.filter(pk__in=expired).delete()
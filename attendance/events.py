@@ -0,0 +1,103 @@
+'''Batched writes to the append-only ``AttendanceEvent`` history.
+
+Marking attendance only appends to an in-process buffer; a background thread
+flushes it with one ``bulk_create`` when ``BATCH_SIZE`` events are waiting or
+``FLUSH_INTERVAL`` seconds after the first one, and the buffer is flushed
+again at interpreter exit.  Events still buffered when a process is killed
+are lost, which is acceptable for history but not for attendance itself, so
+``Attendance`` rows are always written synchronously.
+
+Configured with the ``ATTENDANCE_EVENTS`` setting; ``BATCH_SIZE = 1`` writes
+every event immediately.
+'''
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import AttendanceEvent
+
+logger = logging.getLogger(__name__)
+
+
+class EventBuffer:
+    def __init__(self, batch_size=100, flush_interval=1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._events = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+
+    def add(self, events):
+        events = list(events)
+        if not events:
+            return
+        with self._lock:
+            was_empty = not self._events
+            self._events.extend(events)
+            if len(self._events) < self.batch_size and self.flush_interval:
+                self._start()
+                if was_empty:
+                    self._wakeup.notify()
+                return
+            batch, self._events = self._events, []
+        self._write(batch)
+
+    def flush(self):
+        with self._lock:
+            batch, self._events = self._events, []
+        self._write(batch)
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='attendance-events', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._events:
+                    self._wakeup.wait()
+            # give the batch time to fill up before writing it
+            time.sleep(self.flush_interval)
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            AttendanceEvent.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception:
+            logger.exception('Could not write %d attendance events', len(batch))
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            config = getattr(settings, 'ATTENDANCE_EVENTS', {})
+            _buffer = EventBuffer(config.get('BATCH_SIZE', 100), config.get('FLUSH_INTERVAL', 1.0))
+            atexit.register(_buffer.flush)
+        return _buffer
+
+
+def record(employee_ids, kind, timestamp, source=''):
+    get_buffer().add(AttendanceEvent(employee_id=pk, timestamp=timestamp, kind=kind, source=source)
+                     for pk in employee_ids)
+
+
+def flush():
+    'Write every buffered event now.'
+    get_buffer().flush()
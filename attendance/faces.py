@@ -0,0 +1,179 @@
+'''Face detection and encoding jobs.
+
+These run inside the inference worker processes (see ``attendance.inference``),
+so they take and return plain bytes/arrays and import ``face_recognition``
+lazily instead of touching Django.
+'''
+import functools
+import importlib.util
+import io
+import os
+import time
+
+import numpy as np
+
+
+@functools.lru_cache(maxsize=None)
+def available():
+    'Whether face_recognition is installed, checked without importing it (and dlib with it).'
+    return importlib.util.find_spec('face_recognition') is not None
+
+
+def load_image(image_bytes):
+    import face_recognition
+
+    return face_recognition.load_image_file(io.BytesIO(image_bytes))
+
+
+# Detection/encoding parameters; see FACE_DETECTION_PROFILES in settings.
+DEFAULT_PROFILE = {
+    'SCALE': 1.0,        # detect on the image downscaled by this factor
+    'UPSAMPLE': 1,       # number_of_times_to_upsample for the detector
+    'MODEL': 'hog',      # 'hog' (CPU) or 'cnn' (much slower without CUDA)
+    'NUM_JITTERS': 1,    # re-samples averaged per encoding
+}
+
+
+def locate_faces(image, profile=DEFAULT_PROFILE):
+    '''Face boxes (top, right, bottom, left) in ``image`` coordinates.
+
+    With ``SCALE`` < 1 the detector runs on a downscaled copy; HOG cost grows
+    with pixel count, so 0.5 is roughly four times cheaper.
+    '''
+    import face_recognition
+    from PIL import Image
+
+    scale = profile['SCALE']
+    detect = {'number_of_times_to_upsample': profile['UPSAMPLE'], 'model': profile['MODEL']}
+    if scale >= 1.0:
+        return face_recognition.face_locations(image, **detect)
+    height, width = image.shape[:2]
+    small = np.asarray(Image.fromarray(image).resize((max(1, round(width * scale)), max(1, round(height * scale)))))
+    return [(round(top / scale), min(width, round(right / scale)), min(height, round(bottom / scale)), round(left / scale))
+            for top, right, bottom, left in face_recognition.face_locations(small, **detect)]
+
+
+def _clamp_box(box, image):
+    height, width = image.shape[:2]
+    top, right, bottom, left = box
+    top, left = max(0, top), max(0, left)
+    bottom, right = min(height, bottom), min(width, right)
+    if bottom - top < 20 or right - left < 20:
+        return None
+    return top, right, bottom, left
+
+
+def encode_image(image_bytes, face_box=None, profile=DEFAULT_PROFILE):
+    '''Encodings (float32, 128-d) for the faces in an encoded image.
+
+    ``face_box`` is a client-supplied (top, right, bottom, left) hint; when it
+    is valid detection is skipped and only that box is encoded.  Otherwise
+    faces are detected according to ``profile``.  Either way the detected
+    locations are handed to ``face_encodings`` so detection runs only once,
+    and encodings are computed at full resolution.
+    '''
+    return encode_image_timed(image_bytes, face_box, profile)[0]
+
+
+def encode_image_timed(image_bytes, face_box=None, profile=DEFAULT_PROFILE):
+    '''``encode_image`` that also returns the seconds spent per stage.
+
+    Returns ``(encodings, {'image_decode': s, 'detection': s, 'encoding': s})``
+    for ``attendance.metrics``; the stages run in the worker, out of sight
+    of the view.
+    '''
+    import face_recognition
+
+    clock = time.perf_counter
+    start = clock()
+    image = load_image(image_bytes)
+    decoded = clock()
+    box = _clamp_box(face_box, image) if face_box else None
+    locations = [box] if box else locate_faces(image, profile)
+    detected = clock()
+    encodings = []
+    if locations:
+        encodings = face_recognition.face_encodings(image, known_face_locations=locations,
+                                                    num_jitters=profile['NUM_JITTERS'])
+    stages = {'image_decode': decoded - start, 'detection': detected - decoded, 'encoding': clock() - detected}
+    return [encoding.astype(np.float32) for encoding in encodings], stages
+
+
+def encode_frame(image_bytes, profile=DEFAULT_PROFILE):
+    '''Encodings of one burst frame, plus a 32x32 grayscale thumbnail of its first face (None without one).
+
+    The thumbnails of consecutive frames feed the liveness check in
+    ``attendance.burst``.
+    '''
+    import face_recognition
+    from PIL import Image
+
+    image = load_image(image_bytes)
+    locations = locate_faces(image, profile)
+    if not locations:
+        return [], None
+    encodings = face_recognition.face_encodings(image, known_face_locations=locations,
+                                                num_jitters=profile['NUM_JITTERS'])
+    top, right, bottom, left = locations[0]
+    face = image[max(top, 0):bottom, max(left, 0):right]
+    thumbnail = np.asarray(Image.fromarray(face).convert('L').resize((32, 32)), dtype=np.float32)
+    return [encoding.astype(np.float32) for encoding in encodings], thumbnail
+
+
+# Enrollment image checks; see FACE_ENROLLMENT_QUALITY in settings.
+DEFAULT_QUALITY = {
+    'MIN_FACE_SIZE': 80,     # pixels across the detected face
+    'MIN_SHARPNESS': 30.0,   # Laplacian variance of the face in grayscale
+}
+
+
+def sharpness(gray):
+    'Variance of the Laplacian of a grayscale image; blurry images score low.'
+    gray = gray.astype(np.float32)
+    laplacian = gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1] - 4 * gray[1:-1, 1:-1]
+    return float(laplacian.var())
+
+
+def check_enrollment(image_bytes, profile=DEFAULT_PROFILE, quality=DEFAULT_QUALITY):
+    '''Encode an enrollment image after checking that it is usable.
+
+    Returns ``(encoding, None)``, or ``(None, reason)`` when the image does
+    not show exactly one face, or the face is too small or too blurry for
+    ``quality``.
+    '''
+    import face_recognition
+
+    image = load_image(image_bytes)
+    locations = locate_faces(image, profile)
+    if not locations:
+        return None, 'No face detected'
+    if len(locations) > 1:
+        return None, 'More than one face detected'
+    top, right, bottom, left = locations[0]
+    if min(bottom - top, right - left) < quality['MIN_FACE_SIZE']:
+        return None, 'Face is too small, move closer to the camera'
+    face = image[max(top, 0):bottom, max(left, 0):right]
+    if sharpness(face @ np.array([0.299, 0.587, 0.114])) < quality['MIN_SHARPNESS']:
+        return None, 'Image is too blurry, hold still and try again'
+    encodings = face_recognition.face_encodings(image, known_face_locations=locations,
+                                                num_jitters=profile['NUM_JITTERS'])
+    return encodings[0].astype(np.float32), None
+
+
+def warm_up():
+    'Worker initializer: load the dlib models before the first job arrives.'
+    import face_recognition  # noqa: F401
+
+
+def warm_up_inference():
+    '''Run detection and encoding once on a blank image; returns the process id.
+
+    Importing face_recognition loads the models, but the first detection and
+    encoding in a process still pay for allocating dlib's buffers.
+    '''
+    import face_recognition
+
+    image = np.zeros((120, 120, 3), dtype=np.uint8)
+    face_recognition.face_locations(image)
+    face_recognition.face_encodings(image, known_face_locations=[(10, 110, 110, 10)])
+    return os.getpid()
@@ -0,0 +1,309 @@
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+
+from .encoding import ENCODING_SIZE, unpack_encoding
+from .matching import Match, get_matcher
+
+
+class FaceGallery:
+    '''Process-wide matrix of enrolled face encodings.
+
+    Rows of ``encodings`` (float32, N x 128) line up with ``employee_ids``
+    (the EmployeeProfile primary keys).  The gallery is loaded from the
+    database on first use; recognition otherwise never touches the ORM.
+    Enrollment changes, in this process or another, bump a version in
+    ``attendance.caching`` (see ``scope`` and ``invalidate``): a gallery whose
+    version moved on since it was loaded, or older than
+    ``FACE_GALLERY['MAX_AGE']`` seconds, reloads before its next search.
+    Lookups go through the matcher configured by ``FACE_MATCHER``.
+
+    The matrix holds each employee's centroid encoding.  With ``rerank``
+    (``FACE_TEMPLATES['RERANK']``) the gallery also keeps every employee's
+    enrollment templates: the ``rerank`` nearest centroids are re-scored by
+    their closest template before the best match is picked.
+
+    With ``site`` the gallery is a shard holding only the employees of that
+    site (see ``attendance.sites``).
+    '''
+
+    def __init__(self, matcher=None, rerank=None, site=None):
+        self._lock = threading.Lock()
+        self.site = site
+        self._matcher = matcher
+        if rerank is None:
+            rerank = getattr(settings, 'FACE_TEMPLATES', {}).get('RERANK', 0)
+        self.rerank = rerank
+        self._templates = {}
+        self._loaded = False
+        self._matrix = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._rows = {}
+        self._size = 0
+        # version of scope(site) the rows were loaded at; None when not loaded from the database
+        self._version = None
+        self._loaded_at = 0.0
+        self.max_age = getattr(settings, 'FACE_GALLERY', {}).get('MAX_AGE')
+        self._reload_lock = threading.Lock()
+
+    @property
+    def encodings(self):
+        self._ensure_loaded()
+        return self._matrix[:self._size]
+
+    @property
+    def employee_ids(self):
+        self._ensure_loaded()
+        return self._ids[:self._size]
+
+    def __len__(self):
+        self._ensure_loaded()
+        return self._size
+
+    @property
+    def loaded_size(self):
+        'Rows held right now; unlike ``len()`` never loads or reloads, so it is safe on an event loop.'
+        return self._size
+
+    @property
+    def scope(self):
+        return scope(self.site)
+
+    def _ensure_loaded(self):
+        if self._loaded and (self._version is None or not self._stale()):
+            return
+        with self._reload_lock:
+            if not self._loaded:
+                self.reload()
+            elif self._stale():
+                self.reload()
+                from .recent import get_recent_matches
+
+                # remembered matches may predate the other process's change
+                get_recent_matches().clear()
+
+    def _stale(self):
+        'Whether the rows may be out of date: another process changed them, or they are older than ``max_age``.'
+        from . import caching
+
+        if self.max_age and time.monotonic() - self._loaded_at > self.max_age:
+            return True
+        return caching.versions([self.scope])[self.scope] != self._version
+
+    def reload(self):
+        from . import caching
+        from .models import EmployeeProfile
+
+        # read before the rows, so a change committed meanwhile shows up as a newer version
+        version = caching.versions([self.scope])[self.scope]
+        rows = EmployeeProfile.objects.exclude(face_encoding__isnull=True)
+        if self.site is not None:
+            rows = rows.filter(site=self.site)
+        rows = rows.values_list('pk', 'face_encoding')
+        ids = []
+        vectors = []
+        for pk, raw in rows.iterator():
+            vector = unpack_encoding(raw)
+            if vector is not None:
+                ids.append(pk)
+                vectors.append(vector)
+        self.load_arrays(ids, vectors, self._load_templates())
+        self._version = version
+        self._loaded_at = time.monotonic()
+
+    def _load_templates(self, employee_ids=None):
+        'Stored templates as ``{employee pk: array}``; empty unless re-ranking.'
+        from .models import FaceTemplate
+
+        if not self.rerank:
+            return {}
+        rows = FaceTemplate.objects.order_by().values_list('employee_id', 'encoding')
+        if employee_ids is not None:
+            rows = rows.filter(employee_id__in=employee_ids)
+        elif self.site is not None:
+            rows = rows.filter(employee__site=self.site)
+        grouped = defaultdict(list)
+        for pk, raw in rows.iterator():
+            vector = unpack_encoding(raw)
+            if vector is not None:
+                grouped[pk].append(vector)
+        return {pk: np.array(vectors, dtype=np.float32) for pk, vectors in grouped.items()}
+
+    def load_arrays(self, ids, vectors, templates=None):
+        '''Replace the whole gallery with ``vectors`` for the employee pks in ``ids``.
+
+        ``templates`` optionally maps employee pks to arrays of their enrollment templates.
+        '''
+        with self._lock:
+            self._matrix = np.array(vectors, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+            self._ids = np.array(ids, dtype=np.int64)
+            self._rows = {int(pk): row for row, pk in enumerate(ids)}
+            self._size = len(ids)
+            self._templates = dict(templates or {})
+            if self._matcher is None:
+                self._matcher = get_matcher(self.site)
+            self._matcher.rebuild(self._matrix)
+            self._loaded = True
+            self._version = None
+
+    def refresh(self, employee_id):
+        'Reload one employee\'s centroid and templates from the database.'
+        refresh_employee(employee_id, [self])
+
+    def upsert(self, employee_id, vector, templates=None):
+        'Insert or replace the encoding (and templates) for one employee.'
+        if not self._loaded:
+            return
+        with self._lock:
+            if templates is None:
+                self._templates.pop(employee_id, None)
+            else:
+                self._templates[employee_id] = templates
+            row = self._rows.get(employee_id)
+            if row is None:
+                row = self._size
+                if row == len(self._matrix):
+                    self._grow()
+                self._ids[row] = employee_id
+                self._rows[employee_id] = row
+                self._size += 1
+            self._matrix[row] = vector
+            self._matcher.update(row, self._matrix[row])
+
+    def remove(self, employee_id):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._templates.pop(employee_id, None)
+            row = self._rows.pop(employee_id, None)
+            if row is None:
+                return
+            # keep the matrix dense by moving the last row into the hole
+            last = self._size - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = self._ids[last]
+                self._rows[int(self._ids[row])] = row
+                self._matcher.move(last, row)
+            self._size = last
+            self._matcher.truncate(last)
+
+    def _grow(self):
+        capacity = max(2 * len(self._matrix), 64)
+        matrix = np.empty((capacity, ENCODING_SIZE), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids = np.empty(capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix = matrix
+        self._ids = ids
+
+    def match(self, vector):
+        'Closest enrolled employee to ``vector`` as a ``Match``, or None if the gallery is empty.'
+        return self.match_many(np.asarray(vector, dtype=np.float32)[None, :])[0]
+
+    def match_many(self, vectors):
+        'Closest enrolled employee for each row of ``vectors``, in one search.'
+        self._ensure_loaded()
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            rerank = self.rerank if self._templates else 0
+            rows, distances = self._matcher.search(self._matrix[:self._size], vectors, k=max(2, rerank))
+            ids = self._ids[np.maximum(rows, 0)] if rows.size else rows
+            templates = self._templates
+            if rerank:
+                distances = distances.copy()
+                for i, vector in enumerate(vectors):
+                    for j in range(rows.shape[1]):
+                        stored = templates.get(int(ids[i, j])) if rows[i, j] >= 0 else None
+                        if stored is not None:
+                            closest = np.sqrt(((stored - vector) ** 2).sum(axis=1).min())
+                            distances[i, j] = min(distances[i, j], closest)
+        if rerank:
+            order = np.argsort(distances, axis=1, kind='stable')
+            rows = np.take_along_axis(rows, order, axis=1)
+            ids = np.take_along_axis(ids, order, axis=1)
+            distances = np.take_along_axis(distances, order, axis=1)
+        matches = []
+        for i in range(len(vectors)):
+            if not rows.shape[1] or rows[i, 0] < 0:
+                matches.append(None)
+                continue
+            runner_up = distances[i, 1] if rows.shape[1] > 1 and rows[i, 1] >= 0 else np.inf
+            matches.append(Match(int(ids[i, 0]), float(distances[i, 0]), float(runner_up - distances[i, 0])))
+        return matches
+
+
+_gallery = FaceGallery()
+_shards = {}
+_shards_lock = threading.Lock()
+
+
+def scope(site=None):
+    '''``attendance.caching`` scope whose version changes with the employees of ``site``'s shard (or of every employee).'''
+    # hashed: site names may hold characters a cache key cannot
+    return 'gallery' if site is None else f'gallery:{hashlib.sha1(site.encode()).hexdigest()}'
+
+
+def get_gallery(site=None):
+    '''The gallery of every enrolled employee, or with ``site`` the shard of that site's employees.
+
+    Shards are created on first use and load themselves lazily, each on its own.
+    '''
+    if site is None:
+        return _gallery
+    with _shards_lock:
+        shard = _shards.get(site)
+        if shard is None:
+            shard = _shards[site] = FaceGallery(site=site)
+        return shard
+
+
+def _all_galleries():
+    with _shards_lock:
+        return [_gallery, *_shards.values()]
+
+
+def refresh_employee(employee_id, galleries=None):
+    '''Reload one employee into ``galleries`` (default: the global gallery and every shard) with one query.
+
+    The employee is updated in the galleries they belong to and removed from
+    any shard they have left; other shards, and galleries not loaded yet,
+    are not touched.
+    '''
+    from .models import EmployeeProfile
+
+    galleries = [gallery for gallery in (galleries or _all_galleries()) if gallery._loaded]
+    if not galleries:
+        return
+    site, raw = (EmployeeProfile.objects.filter(pk=employee_id)
+                 .values_list('site', 'face_encoding').first() or (None, None))
+    vector = unpack_encoding(raw)
+    templates = {}
+    for gallery in galleries:
+        if vector is None or gallery.site not in (None, site):
+            gallery.remove(employee_id)
+            continue
+        if gallery.rerank not in templates:
+            templates[gallery.rerank] = gallery._load_templates([employee_id]).get(employee_id)
+        gallery.upsert(employee_id, vector, templates[gallery.rerank])
+
+
+def remove_employee(employee_id):
+    'Drop a deleted employee from the global gallery and every shard.'
+    for gallery in _all_galleries():
+        gallery.remove(employee_id)
+
+
+def invalidate(sites=()):
+    '''Make every process reload the global gallery and the shards of ``sites`` once the transaction commits.
+
+    This process reloads too: with several writers it cannot tell whether its
+    rows already hold every change the new version stands for.
+    '''
+    from . import caching
+
+    caching.bump(scope(), *{scope(site) for site in sites if site})
@@ -0,0 +1,164 @@
+'''Process pool that runs face encoding off the request thread.
+
+Views submit jobs from ``attendance.faces`` through ``get_inference()``.  At
+most ``WORKERS + MAX_QUEUE`` jobs are admitted at once; past that
+``InferenceOverloaded`` is raised straight away so the view can answer 503
+instead of queueing unbounded work.  Configured by ``FACE_INFERENCE``::
+
+    FACE_INFERENCE = {
+        'WORKERS': 1,        # per web process; 0 runs jobs inline in the request thread
+        'MAX_QUEUE': 8,      # admitted jobs waiting for a free worker
+        'TIMEOUT': 10,       # seconds a view waits for one job
+        'RETRY_AFTER': 2,    # seconds suggested to clients on overload
+    }
+
+Every web process (each gunicorn or uvicorn worker) starts its own pool, so
+a server runs ``web workers x WORKERS`` encoding processes, each holding
+the dlib models; keep that product at about the number of CPU cores.
+'''
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from . import faces
+
+
+class InferenceUnavailable(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class InferenceOverloaded(InferenceUnavailable):
+    pass
+
+
+class InferenceTimeout(InferenceUnavailable):
+    pass
+
+
+class InferenceService:
+
+    def __init__(self, workers=1, max_queue=8, timeout=10, retry_after=2):
+        self.workers = workers
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + max_queue)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn rather than fork: the web process may already be running threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=faces.warm_up,
+                )
+            return self._executor
+
+    def _reset_executor(self, executor):
+        if executor is None:
+            return
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, func, *args, block=False):
+        '''Admit a job or raise ``InferenceOverloaded``; returns a Future.
+
+        With ``block`` wait up to ``timeout`` seconds for a slot instead of
+        failing straight away.
+        '''
+        if not (self._slots.acquire(timeout=self.timeout) if block else self._slots.acquire(blocking=False)):
+            raise InferenceOverloaded('Face recognition is busy, please retry', self.retry_after)
+
+        if not self.workers:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as exc:
+                future.set_exception(exc)
+            finally:
+                self._slots.release()
+            return future
+
+        executor = self._get_executor()
+        try:
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            self._reset_executor(executor)
+            self._slots.release()
+            raise InferenceOverloaded('Face recognition workers restarting, please retry', self.retry_after)
+        # the slot is held until the job really finishes, even if the caller gave up on it
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def result(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise InferenceTimeout('Face recognition timed out, please retry', self.retry_after)
+        except BrokenProcessPool:
+            self._reset_executor(self._executor)
+            raise InferenceOverloaded('Face recognition workers restarting, please retry', self.retry_after)
+
+    def run(self, func, *args):
+        return self.result(self.submit(func, *args))
+
+    async def arun(self, func, *args):
+        'Like ``run`` but awaits the job instead of blocking the event loop.'
+        if not self.workers:
+            return await asyncio.to_thread(self.run, func, *args)
+        future = self.submit(func, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise InferenceTimeout('Face recognition timed out, please retry', self.retry_after)
+        except BrokenProcessPool:
+            self._reset_executor(self._executor)
+            raise InferenceOverloaded('Face recognition workers restarting, please retry', self.retry_after)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_inference():
+    global _service
+    with _service_lock:
+        if _service is None:
+            config = getattr(settings, 'FACE_INFERENCE', {})
+            _service = InferenceService(
+                workers=config.get('WORKERS', 1),
+                max_queue=config.get('MAX_QUEUE', 8),
+                timeout=config.get('TIMEOUT', 10),
+                retry_after=config.get('RETRY_AFTER', 2),
+            )
+        return _service
+
+
+def get_detection_profile(name):
+    '''The ``FACE_DETECTION_PROFILES[name]`` settings merged over ``faces.DEFAULT_PROFILE``.'''
+    profiles = getattr(settings, 'FACE_DETECTION_PROFILES', {})
+    return {**faces.DEFAULT_PROFILE, **profiles.get(name, {})}
+
+
+
+def get_enrollment_quality():
+    '''The ``FACE_ENROLLMENT_QUALITY`` settings merged over ``faces.DEFAULT_QUALITY``.'''
+    return {**faces.DEFAULT_QUALITY, **getattr(settings, 'FACE_ENROLLMENT_QUALITY', {})}
@@ -0,0 +1,154 @@
+'''Background generation of attendance reports.
+
+``submit_report`` records a ``ReportJob`` and hands it to a small in-process
+thread pool, so the web worker returns immediately with a job id.  Finished
+workbooks are stored under ``MEDIA_ROOT/reports/`` and reused for identical
+requests: the job's ``cache_key`` covers the employee set, date range,
+options, the row count of the matching ``Attendance`` rows and each
+employee's ``attendance.caching`` version, which signals and
+``mark_present`` bump on any change to their attendance, profile or name.
+So a new check-in, an edited status or a renamed employee produces a new
+key and a fresh report.  Finished jobs and their files are deleted
+``REPORT_RETENTION`` seconds after they finish; a job whose file has gone
+from storage is marked failed.
+
+The thread pool does not survive a restart.  A pending or running job that
+this process is not working on and that is older than
+``REPORT_JOB_TIMEOUT`` seconds is taken as lost: it is marked failed and an
+identical request queues the report again.
+'''
+import hashlib
+import json
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from . import caching
+from .models import Attendance, EmployeeProfile, ReportJob
+from .reports import write_attendance_workbook
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# pks of the jobs queued or running in this process
+_owned = set()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'REPORT_WORKERS', 2),
+                                           thread_name_prefix='attendance-report')
+        return _executor
+
+
+def report_cache_key(employees, employee_ids, start_date, end_date, charts):
+    version = (Attendance.objects
+               .filter(employee__in=employees.values('pk'), date__range=(start_date, end_date))
+               .aggregate(rows=Count('id'), last=Max('id')))
+    # the row count and last id catch inserts and deletes; the versions catch edits in place
+    employee_versions = caching.versions([f'employee:{pk}' for pk in employee_ids])
+    payload = json.dumps([sorted(employee_ids), str(start_date), str(end_date), charts, version['rows'], version['last'],
+                          [str(employee_versions[f'employee:{pk}']) for pk in sorted(employee_ids)]])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def submit_report(user, employees, start_date, end_date, charts=False, department=''):
+    '''Return a job for this report: a cached finished one, one already in progress, or a new one.'''
+    employee_ids = list(employees.order_by('pk').values_list('pk', flat=True))
+    cache_key = report_cache_key(employees, employee_ids, start_date, end_date, charts)
+
+    existing = (ReportJob.objects
+                .filter(cache_key=cache_key)
+                .exclude(status=ReportJob.FAILED)
+                .order_by('-created_at')
+                .first())
+    if existing and not fail_if_lost(existing) and not fail_if_file_missing(existing):
+        return existing
+
+    job = ReportJob.objects.create(
+        requested_by=user if user and user.is_authenticated else None,
+        cache_key=cache_key,
+        employee_ids=employee_ids,
+        department=department,
+        start_date=start_date,
+        end_date=end_date,
+        charts=charts,
+    )
+    with _executor_lock:
+        _owned.add(job.pk)
+    _get_executor().submit(run_report, job.pk)
+    return job
+
+
+def fail_if_lost(job):
+    '''Mark ``job`` failed if it is unfinished but no process can still be working on it; returns whether it was.'''
+    if job.status not in (ReportJob.PENDING, ReportJob.RUNNING):
+        return False
+    with _executor_lock:
+        if job.pk in _owned:
+            return False
+    # another worker process may still be running a recent job
+    if timezone.now() - job.created_at < timedelta(seconds=getattr(settings, 'REPORT_JOB_TIMEOUT', 900)):
+        return False
+    error = 'The report was interrupted by a restart, please request it again'
+    updated = (ReportJob.objects
+               .filter(pk=job.pk, status__in=[ReportJob.PENDING, ReportJob.RUNNING])
+               .update(status=ReportJob.FAILED, error=error, finished_at=timezone.now()))
+    job.refresh_from_db()
+    return bool(updated)
+
+
+def fail_if_file_missing(job):
+    '''Mark a finished ``job`` failed if its workbook is no longer in storage; returns whether it was.'''
+    if job.status != ReportJob.DONE or (job.file and job.file.storage.exists(job.file.name)):
+        return False
+    ReportJob.objects.filter(pk=job.pk).update(status=ReportJob.FAILED, error='The report file is no longer available, please request it again')
+    job.refresh_from_db()
+    return True
+
+
+def prune_reports():
+    '''Delete jobs that finished more than ``REPORT_RETENTION`` seconds ago, and their files.'''
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'REPORT_RETENTION', 7 * 24 * 3600))
+    old = ReportJob.objects.filter(finished_at__lt=cutoff)
+    for job in old.exclude(file='').exclude(file__isnull=True).only('pk', 'file'):
+        job.file.delete(save=False)
+    old.delete()
+
+
+def run_report(job_id):
+    close_old_connections()
+    try:
+        job = ReportJob.objects.get(pk=job_id)
+        job.status = ReportJob.RUNNING
+        job.save(update_fields=['status'])
+
+        employees = EmployeeProfile.objects.filter(pk__in=job.employee_ids)
+        with tempfile.TemporaryFile() as output:
+            write_attendance_workbook(output, employees, job.start_date, job.end_date, charts=job.charts)
+            output.seek(0)
+            label = job.department or 'employees'
+            job.file.save(f'{label}_{job.start_date}_to_{job.end_date}_{job.pk}.xlsx', File(output), save=False)
+
+        job.status = ReportJob.DONE
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'file', 'finished_at'])
+        prune_reports()
+    except Exception as exc:
+        logger.exception('Report job %s failed', job_id)
+        ReportJob.objects.filter(pk=job_id).update(status=ReportJob.FAILED, error=str(exc), finished_at=timezone.now())
+    finally:
+        with _executor_lock:
+            _owned.discard(job_id)
+        close_old_connections()
@@ -0,0 +1,118 @@
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from attendance.benchmarks import SCENARIOS, SkipScenario
+
+
+class Command(BaseCommand):
+    help = ('Run attendance micro-benchmarks on synthetic data. With --json the results are also written '
+            'as JSON, which --compare reads back to report regressions between commits.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Scenarios to run (default: all). Available: {", ".join(SCENARIOS)}')
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--gallery-sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Enrolled profiles for the gallery and recognition scenarios')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--rows', type=int, default=1000000, help='Attendance rows for database scenarios')
+        parser.add_argument('--images', help='Labelled image directory (one sub-directory per person) for accuracy scenarios')
+        parser.add_argument('--concurrency', type=int, default=200, help='Simultaneous requests for load scenarios')
+        parser.add_argument('--json', metavar='PATH', help='Write the results as JSON to PATH (- for stdout)')
+        parser.add_argument('--compare', metavar='PATH', help='JSON results of an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='With --compare, fail when a case is slower by more than this fraction, or runs more queries')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f'Unknown scenario(s): {", ".join(unknown)}')
+        # keep the table off stdout when the JSON goes there
+        out = self.stderr if options['json'] == '-' else self.stdout
+
+        report = {}
+        for name in names:
+            out.write(self.style.MIGRATE_HEADING(name))
+            try:
+                results = SCENARIOS[name](options)
+            except SkipScenario as exc:
+                out.write(self.style.WARNING(f'  skipped: {exc}'))
+                report[name] = {'skipped': str(exc)}
+                continue
+            report[name] = {'results': results}
+            for result in results:
+                extras = '  '.join(f'{key}={value:.4g}' if isinstance(value, float) else f'{key}={value}'
+                                   for key, value in result.items() if key not in ('case', 'seconds'))
+                out.write(f'  {result["case"]:<34} {result["seconds"] * 1000:10.2f} ms  {extras}')
+
+        if options['json']:
+            document = json.dumps(self._metadata(options) | {'scenarios': report}, indent=2, default=_plain)
+            if options['json'] == '-':
+                self.stdout.write(document)
+            else:
+                with open(options['json'], 'w') as handle:
+                    handle.write(document + '\n')
+        if options['compare']:
+            self._compare(report, options['compare'], options['threshold'], out)
+
+    def _metadata(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                                    text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'django': django.get_version(),
+            'platform': platform.platform(),
+            'database': connection.vendor,
+            'options': {key: options[key] for key in ('sizes', 'gallery_sizes', 'repeat', 'rows', 'concurrency')},
+        }
+
+    def _compare(self, report, path, threshold, out):
+        try:
+            with open(path) as handle:
+                baseline = json.load(handle)['scenarios']
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f'Cannot read benchmark results from {path}: {exc}')
+
+        out.write(self.style.MIGRATE_HEADING(f'compared with {path}'))
+        regressions = []
+        for name, current in report.items():
+            before = {result['case']: result for result in baseline.get(name, {}).get('results', [])}
+            for result in current.get('results', []):
+                old = before.get(result['case'])
+                if not old or not old['seconds']:
+                    continue
+                change = result['seconds'] / old['seconds'] - 1
+                line = (f'  {name}: {result["case"]:<34} {old["seconds"] * 1000:10.2f} -> '
+                        f'{result["seconds"] * 1000:10.2f} ms  {change:+.1%}')
+                # query counts do not jitter: any increase is a regression
+                queries_grew = result.get('queries', 0) > old.get('queries', result.get('queries', 0))
+                if queries_grew:
+                    line += f'  queries {old["queries"]} -> {result["queries"]}'
+                if change > threshold or queries_grew:
+                    regressions.append(f'{name}: {result["case"]}')
+                    out.write(self.style.ERROR(line))
+                else:
+                    out.write(line)
+        if regressions:
+            raise CommandError(f'{len(regressions)} case(s) slower by more than {threshold:.0%} or running more '
+                               f'queries: {", ".join(regressions)}')
+
+
+def _plain(value):
+    # numpy scalars
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.gallery import FaceGallery
+from attendance.matching import IVFMatcher, get_matcher
+from attendance.models import Kiosk
+
+
+class Command(BaseCommand):
+    help = ('Retrain the approximate face index from the current gallery and save it to disk, '
+            'along with the index of each site shard kiosks match against.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--site', action='append', dest='sites', metavar='SITE',
+                            help='Only retrain the shard index of this site (repeatable)')
+
+    def handle(self, *args, **options):
+        matcher = get_matcher()
+        if not isinstance(matcher, IVFMatcher):
+            raise CommandError('FACE_MATCHER does not use an IVF index; nothing to build.')
+        if not matcher.index_path:
+            raise CommandError("Set FACE_MATCHER['OPTIONS']['index_path'] to persist the index.")
+
+        if options['sites']:
+            sites = options['sites']
+        else:
+            # shards are only searched for kiosks with a site, see attendance.sites
+            sites = sorted(set(Kiosk.objects.exclude(site='').values_list('site', flat=True)))
+            if not self._build(None):
+                raise CommandError('No enrolled face encodings.')
+        for site in sites:
+            if not self._build(site):
+                self.stdout.write(self.style.WARNING(f'Site {site}: no enrolled face encodings, skipped.'))
+
+    def _build(self, site):
+        'Train and save the index of the global gallery or of the shard of ``site``; returns False if it is empty.'
+        matcher = get_matcher(site)
+        gallery = FaceGallery(matcher=matcher, site=site)
+        matrix = gallery.encodings
+        if not len(matrix):
+            return False
+        matcher.train(matrix)
+        matcher.save()
+        label = 'Global' if site is None else f'Site {site}'
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: trained {len(matcher.centroids)} partitions over {len(matrix)} encodings -> {matcher.index_path}'))
+        return True
@@ -0,0 +1,55 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from attendance import querychecks, summaries
+from attendance.benchmarks import benchmark_database, populate_attendance
+from attendance.models import EmployeeProfile
+
+
+class Command(BaseCommand):
+    help = ('Check query plans and per-view query counts against a throwaway database; '
+            'exits non-zero on a full scan, a sort or a query budget overrun.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=300)
+        parser.add_argument('--days', type=int, default=30)
+
+    def handle(self, *args, **options):
+        failures = []
+        with benchmark_database():
+            dates = populate_attendance(options['employees'], options['days'])
+            summaries.rebuild()
+            querychecks.analyze()
+
+            self.stdout.write(self.style.MIGRATE_HEADING('query plans'))
+            if connection.vendor != 'sqlite':
+                self.stdout.write(self.style.WARNING(f'  skipped: plan checks need SQLite, not {connection.vendor}'))
+            else:
+                for name, plan, problem in querychecks.check_plans(dates):
+                    self._report(name, problem, failures)
+                    if problem or options['verbosity'] > 1:
+                        for line in plan.splitlines():
+                            self.stdout.write(f'      {line}')
+
+            self.stdout.write(self.style.MIGRATE_HEADING('query counts'))
+            employee = EmployeeProfile.objects.order_by('pk').first()
+            user = employee.user
+            user.is_staff = True
+            user.save(update_fields=['is_staff'])
+            client = Client()
+            client.force_login(User.objects.get(pk=user.pk))
+            for name, count, budget, problem in querychecks.check_counts(client, employee, dates):
+                self._report(f'{name}: {count} queries (budget {budget})', problem, failures)
+
+        if failures:
+            raise CommandError(f'{len(failures)} query check(s) failed: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('All query checks passed.'))
+
+    def _report(self, name, problem, failures):
+        if problem:
+            failures.append(name)
+            self.stdout.write(self.style.ERROR(f'  FAIL {name}: {problem}'))
+        else:
+            self.stdout.write(f'  ok   {name}')
@@ -0,0 +1,235 @@
+import csv
+import hashlib
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from attendance import caching, enrollment, faces, gallery
+from attendance.encoding import pack_encoding
+from attendance.inference import get_detection_profile, get_enrollment_quality
+from attendance.models import EmployeeProfile
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+
+
+class Command(BaseCommand):
+    help = ('Enroll employees in bulk from a directory of <employee_id>.<ext> images, or from a CSV with '
+            'employee_id and image columns (optional: username, first_name, last_name, email, department, site). '
+            'Faces are encoded in parallel; images whose content has not changed since the last run are skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Image directory or CSV file')
+        parser.add_argument('--department', default='', help='Department for employees the source gives none')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Encoding processes (0 encodes in this process)')
+        parser.add_argument('--batch-size', type=int, default=200, help='Profiles written per transaction')
+        parser.add_argument('--force', action='store_true', help='Re-encode images even when unchanged')
+
+    def handle(self, *args, **options):
+        source = Path(options['source'])
+        if source.is_dir():
+            entries = self._read_directory(source)
+        elif source.is_file():
+            entries = self._read_csv(source)
+        else:
+            raise CommandError(f'{source} is not a directory or CSV file')
+        for entry in entries:
+            entry['department'] = entry.get('department') or options['department']
+
+        self.verbosity = options['verbosity']
+        self.counts = Counter()
+        self.failures = []
+        self.batch_size = options['batch_size']
+        self.pending = []
+        # already enrolled: employee_id -> hash of the image the encoding came from
+        enrolled = dict(EmployeeProfile.objects
+                        .exclude(face_encoding__isnull=True)
+                        .values_list('employee_id', 'face_image_hash'))
+        profile = get_detection_profile('enrollment')
+        quality = get_enrollment_quality()
+        workers = options['workers']
+
+        start = time.perf_counter()
+        encoded = 0
+        seen = set()
+        usernames = set()
+        with self._executor(workers) as pool:
+            in_flight = {}
+            for entry in entries:
+                employee_id = entry['employee_id']
+                username = entry.get('username') or employee_id
+                if employee_id in seen:
+                    self._fail(entry, 'listed more than once')
+                    continue
+                if username in usernames:
+                    self._fail(entry, f'username {username} is listed for another employee')
+                    continue
+                seen.add(employee_id)
+                usernames.add(username)
+                try:
+                    image_bytes = entry['path'].read_bytes()
+                except OSError as exc:
+                    self._fail(entry, f'cannot read image: {exc.strerror or exc}')
+                    continue
+                digest = hashlib.sha256(image_bytes).hexdigest()
+                if not options['force'] and enrolled.get(employee_id) == digest:
+                    self.counts['unchanged'] += 1
+                    continue
+
+                future = pool.submit(faces.check_enrollment, image_bytes, profile, quality)
+                in_flight[future] = (entry, image_bytes, digest)
+                encoded += 1
+                # bound memory: keep a few images per worker queued
+                if len(in_flight) >= max(workers, 1) * 4:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._collect(future, *in_flight.pop(future))
+            for future in list(in_flight):
+                self._collect(future, *in_flight.pop(future))
+        self._write()
+        elapsed = time.perf_counter() - start
+
+        for employee_id, reason in self.failures:
+            self.stdout.write(self.style.WARNING(f'  {employee_id}: {reason}'))
+        rate = encoded / elapsed if elapsed else 0
+        summary = (f'{self.counts["created"]} enrolled, {self.counts["updated"]} updated, '
+                   f'{self.counts["unchanged"]} unchanged, {len(self.failures)} failed '
+                   f'in {elapsed:.1f}s ({rate:.1f} images/s encoded with {workers} workers)')
+        self.stdout.write(self.style.SUCCESS(summary) if not self.failures else self.style.WARNING(summary))
+
+    def _executor(self, workers):
+        if not workers:
+            return ThreadPoolExecutor(max_workers=1)
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=faces.warm_up)
+
+    def _read_directory(self, directory):
+        return [{'employee_id': path.stem, 'path': path}
+                for path in sorted(directory.iterdir())
+                if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS]
+
+    def _read_csv(self, path):
+        with open(path, newline='', encoding='utf-8-sig') as handle:
+            reader = csv.DictReader(handle)
+            missing = {'employee_id', 'image'} - set(reader.fieldnames or [])
+            if missing:
+                raise CommandError(f'{path} is missing column(s): {", ".join(sorted(missing))}')
+            entries = []
+            for row in reader:
+                row = {key: (value or '').strip() for key, value in row.items() if key}
+                if not row['employee_id']:
+                    continue
+                row['path'] = path.parent / row.pop('image')
+                entries.append(row)
+        return entries
+
+    def _fail(self, entry, reason):
+        self.failures.append((entry['employee_id'], reason))
+
+    def _collect(self, future, entry, image_bytes, digest):
+        try:
+            encoding, problem = future.result()
+        except Exception as exc:
+            self._fail(entry, f'cannot encode image: {exc}')
+            return
+        if problem:
+            self._fail(entry, problem)
+            return
+        self.pending.append((entry, image_bytes, digest, encoding))
+        if len(self.pending) >= self.batch_size:
+            self._write()
+
+    def _write(self):
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        with transaction.atomic():
+            profiles = EmployeeProfile.objects.in_bulk([entry['employee_id'] for entry, *_ in batch],
+                                                       field_name='employee_id')
+            new_entries = [entry for entry, *_ in batch if entry['employee_id'] not in profiles]
+            users = self._users_for(new_entries)
+
+            created = []
+            updated = []
+            samples = []
+            replaced_images = []
+            # sites before and after, for the gallery shards to reload
+            sites = set()
+            for entry, image_bytes, digest, encoding in batch:
+                profile = profiles.get(entry['employee_id'])
+                if profile is None:
+                    user = users.get(entry['employee_id'])
+                    if user is None:
+                        continue
+                    profile = EmployeeProfile(user=user, employee_id=entry['employee_id'])
+                    created.append(profile)
+                else:
+                    updated.append(profile)
+                    sites.add(profile.site)
+                if entry['department']:
+                    profile.department = entry['department']
+                if entry.get('site'):
+                    profile.site = entry['site']
+                if profile.face_image:
+                    replaced_images.append(profile.face_image.name)
+                profile.face_image = default_storage.save(f'faces/face_{entry["employee_id"]}{entry["path"].suffix.lower()}',
+                                                          ContentFile(image_bytes))
+                profile.face_image_hash = digest
+                sites.add(profile.site)
+                samples.append((profile, [encoding]))
+
+            # the image becomes one more template; the profile keeps their centroid
+            for (profile, _), centroid in zip(samples, enrollment.centroids(samples)):
+                profile.face_encoding = pack_encoding(centroid)
+            EmployeeProfile.objects.bulk_create(created)
+            if not connection.features.can_return_rows_from_bulk_insert:
+                # e.g. MySQL: bulk_create left the pks unset, and the templates need them
+                pks = dict(EmployeeProfile.objects
+                           .filter(employee_id__in=[profile.employee_id for profile in created])
+                           .values_list('employee_id', 'pk'))
+                for profile in created:
+                    profile.pk = pks[profile.employee_id]
+            EmployeeProfile.objects.bulk_update(updated, ['department', 'site', 'face_image', 'face_image_hash', 'face_encoding'])
+            enrollment.store_templates(samples)
+            caching.bump('profiles', *(f'employee:{profile.pk}' for profile in updated))
+            # bulk writes send no signals; this makes every web worker reload its gallery
+            gallery.invalidate(sites)
+            # only once the new images are committed; a rollback still needs the old ones
+            for name in replaced_images:
+                transaction.on_commit(partial(default_storage.delete, name))
+        self.counts['created'] += len(created)
+        self.counts['updated'] += len(updated)
+        if self.verbosity > 1:
+            self.stdout.write(f'  wrote {len(created)} new and {len(updated)} updated profiles')
+
+    def _users_for(self, entries):
+        '''``{employee_id: User}`` for new profiles, creating accounts (with unusable passwords) as needed.'''
+        usernames = {entry['employee_id']: entry.get('username') or entry['employee_id'] for entry in entries}
+        existing = User.objects.in_bulk(usernames.values(), field_name='username')
+        taken = set(EmployeeProfile.objects.filter(user__in=existing.values()).values_list('user__username', flat=True))
+        User.objects.bulk_create([
+            User(username=usernames[entry['employee_id']], password=make_password(None), email=entry.get('email', ''),
+                 first_name=entry.get('first_name', ''), last_name=entry.get('last_name', ''))
+            for entry in entries
+            if usernames[entry['employee_id']] not in existing
+        ])
+        users = User.objects.in_bulk(usernames.values(), field_name='username')
+
+        result = {}
+        for entry in entries:
+            username = usernames[entry['employee_id']]
+            if username in taken:
+                self._fail(entry, f'user {username} already has another employee profile')
+            else:
+                result[entry['employee_id']] = users[username]
+        return result
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance import faces
+from attendance.benchmarks import labelled_images
+from attendance.gallery import FaceGallery
+from attendance.inference import get_detection_profile
+from attendance.matching import BruteForceMatcher
+
+
+def build_gallery(encoded, samples, rerank):
+    '''Gallery of each person's centroid over their first ``samples`` encodings, with those as templates.'''
+    ids, centroids, templates = [], [], {}
+    for pk, vectors in enumerate(encoded.values()):
+        enrolled = [vector for vector in vectors[:samples] if vector is not None]
+        if enrolled:
+            ids.append(pk)
+            centroids.append(np.mean(enrolled, axis=0))
+            templates[pk] = np.array(enrolled, dtype=np.float32)
+    gallery = FaceGallery(matcher=BruteForceMatcher(), rerank=rerank)
+    gallery.load_arrays(ids, centroids, templates if rerank else None)
+    return gallery
+
+
+def evaluate(encoded, gallery, skip, attempts, tolerance):
+    '''Match every image after the first ``skip`` of each person, as check-ins of up to ``attempts`` captures.
+
+    Returns the false-reject and false-accept rates per capture, the share
+    of check-ins that never succeed and the captures spent per successful
+    check-in (failed check-ins included, as they cost the same).
+    '''
+    captures = accepted = wrong = 0
+    sessions = successes = spent = 0
+    for pk, vectors in enumerate(encoded.values()):
+        probes = vectors[skip:]
+        for start in range(0, len(probes), attempts):
+            sessions += 1
+            for tries, vector in enumerate(probes[start:start + attempts], 1):
+                captures += 1
+                match = gallery.match(vector) if vector is not None else None
+                if match and match.distance <= tolerance:
+                    if match.employee_id == pk:
+                        accepted += 1
+                        successes += 1
+                        break
+                    wrong += 1
+            spent += tries
+    return {
+        'captures': captures,
+        'false_reject_rate': (captures - accepted - wrong) / captures if captures else 0.0,
+        'false_accept_rate': wrong / captures if captures else 0.0,
+        'failed_check_ins': (sessions - successes) / sessions if sessions else 0.0,
+        'attempts_per_check_in': spent / successes if successes else float('inf'),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Offline recognition evaluation on a labelled image set (one sub-directory of photos per person): '
+            'false-reject rate and attempts per check-in with single-capture vs multi-sample enrollment.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', required=True, help='Directory with one sub-directory of photos per person')
+        parser.add_argument('--samples', type=int, default=3, help='Photos per person used for enrollment')
+        parser.add_argument('--attempts', type=int, default=5, help='Captures a kiosk sends before giving up on a check-in')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        try:
+            import face_recognition  # noqa: F401
+        except ImportError:
+            raise CommandError('face_recognition is not installed')
+        images = labelled_images(options['images'])
+        samples = options['samples']
+        images = {label: blobs for label, blobs in images.items() if len(blobs) > samples}
+        if not images:
+            raise CommandError(f'No person under {options["images"]} has more than {samples} photos')
+
+        profile = get_detection_profile('recognition')
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=faces.warm_up) as pool:
+            jobs = {label: [pool.submit(faces.encode_image, blob, None, profile) for blob in blobs]
+                    for label, blobs in images.items()}
+            encoded = {}
+            for label, futures in jobs.items():
+                results = [future.result() for future in futures]
+                encoded[label] = [found[0] if found else None for found in results]
+
+        rerank = getattr(settings, 'FACE_TEMPLATES', {}).get('RERANK', 0) or 8
+        variants = {
+            'single capture': build_gallery(encoded, 1, 0),
+            f'{samples} samples, centroid': build_gallery(encoded, samples, 0),
+            f'{samples} samples, centroid + re-rank {rerank}': build_gallery(encoded, samples, rerank),
+        }
+        tolerance = settings.FACE_MATCH_TOLERANCE
+        self.stdout.write(f'{len(encoded)} people, probes are photos after the first {samples}, tolerance {tolerance}')
+        for name, gallery in variants.items():
+            result = evaluate(encoded, gallery, samples, options['attempts'], tolerance)
+            self.stdout.write(
+                f'  {name:<36} FRR {result["false_reject_rate"]:6.1%}  FAR {result["false_accept_rate"]:6.1%}  '
+                f'failed check-ins {result["failed_check_ins"]:6.1%}  '
+                f'attempts/check-in {result["attempts_per_check_in"]:.2f}  ({result["captures"]} captures)')
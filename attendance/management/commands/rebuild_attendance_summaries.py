@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance import summaries
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}, expected YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Recompute the monthly employee and daily department attendance summaries from Attendance.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First date to rebuild (monthly totals are rebuilt for whole months)')
+        parser.add_argument('--end', help='Last date to rebuild')
+
+    def handle(self, *args, **options):
+        start_date = _parse_date(options['start']) if options['start'] else None
+        end_date = _parse_date(options['end']) if options['end'] else None
+        summaries.rebuild(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS('Attendance summaries rebuilt.'))
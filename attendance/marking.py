@@ -0,0 +1,115 @@
+'''Writing attendance for recognized employees.
+
+``mark_present`` inserts today's rows with ``INSERT ... ON CONFLICT DO
+NOTHING RETURNING``, so two kiosks recognizing the same person at the same
+moment never race: the database decides which insert wins and only the pks
+it really inserted are counted as check-ins.  Backends without it insert
+row by row, each in a savepoint, and count only the inserts that did not
+hit the unique key.  Employees who already have a row get their
+``check_out_time`` moved forward in one ``UPDATE``.  Every sighting is also
+appended to the ``AttendanceEvent`` history through the batched buffer in
+``attendance.events``.
+'''
+from datetime import date, datetime
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from . import caching, events
+from .models import Attendance, AttendanceEvent
+from .summaries import record_check_ins
+
+# rows per INSERT; keeps SQLite well under its bound-parameter limit
+INSERT_BATCH_SIZE = 500
+
+
+def _supports_insert_returning():
+    # ON CONFLICT ... RETURNING: PostgreSQL, and SQLite 3.35+
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def _insert_new(employee_ids, today, now_time):
+    '''Insert a row for each pk without one today; returns the pks actually inserted.'''
+    if not _supports_insert_returning():
+        # other backends: skip rows we can see, then insert the rest one at a
+        # time, each in a savepoint, so a row a concurrent request inserted
+        # first fails on the unique key and is not counted as ours
+        existing = set(Attendance.objects
+                       .filter(date=today, employee_id__in=employee_ids)
+                       .values_list('employee_id', flat=True))
+        created = set()
+        # a fixed order, so two requests inserting overlapping sets do not deadlock
+        for pk in sorted(employee_ids - existing):
+            try:
+                with transaction.atomic():
+                    Attendance.objects.create(employee_id=pk, date=today, check_in_time=now_time, status='Present')
+            except IntegrityError:
+                continue
+            created.add(pk)
+        return created
+
+    meta = Attendance._meta
+    fields = [meta.get_field(name) for name in ('employee', 'date', 'check_in_time', 'status')]
+    qn = connection.ops.quote_name
+    columns = ', '.join(qn(field.column) for field in fields)
+    date_value = fields[1].get_db_prep_value(today, connection)
+    time_value = fields[2].get_db_prep_value(now_time, connection)
+
+    created = set()
+    pks = sorted(employee_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), INSERT_BATCH_SIZE):
+            batch = pks[start:start + INSERT_BATCH_SIZE]
+            placeholders = ', '.join(['(%s, %s, %s, %s)'] * len(batch))
+            params = []
+            for pk in batch:
+                params.extend([pk, date_value, time_value, 'Present'])
+            cursor.execute(
+                f'INSERT INTO {qn(meta.db_table)} ({columns}) VALUES {placeholders} '
+                f'ON CONFLICT ({qn(fields[0].column)}, {qn(fields[1].column)}) DO NOTHING '
+                f'RETURNING {qn(fields[0].column)}',
+                params,
+            )
+            created.update(row[0] for row in cursor.fetchall())
+    return created
+
+
+def mark_present(employee_ids, today=None, now_time=None, source=''):
+    '''Mark today's attendance for every profile pk in ``employee_ids``.
+
+    New rows are checked in at ``now_time`` and counted in the attendance
+    summaries; employees already present today get ``now_time`` as their
+    check-out time (it only ever moves forward), and a missing check-in time
+    is filled in.  Returns the set of pks that got a new row.
+    '''
+    employee_ids = set(employee_ids)
+    if not employee_ids:
+        return set()
+    today = today or date.today()
+    now_time = now_time or datetime.now().time()
+
+    with transaction.atomic():
+        created = _insert_new(employee_ids, today, now_time)
+        record_check_ins(created, today)
+        seen = employee_ids - created
+        if seen:
+            (Attendance.objects
+             .filter(date=today, employee_id__in=seen)
+             .update(check_in_time=Coalesce(F('check_in_time'), Value(now_time)),
+                     check_out_time=Greatest(Coalesce(F('check_out_time'), Value(now_time)), Value(now_time))))
+        # bulk writes send no signals, so invalidate the cached windows here
+        caching.invalidate_employees(employee_ids)
+        caching.bump('headcount')
+
+    timestamp = timezone.now()
+    events.record(created, AttendanceEvent.CHECK_IN, timestamp, source)
+    events.record(seen, AttendanceEvent.SEEN, timestamp, source)
+    return created
+
+
+async def amark_present(employee_ids, today=None, now_time=None, source=''):
+    'Async version of ``mark_present``; the writes run in one transaction on a worker thread.'
+    return await sync_to_async(mark_present)(employee_ids, today, now_time, source)
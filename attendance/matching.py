@@ -0,0 +1,212 @@
+'''Nearest-neighbour search over the face gallery.
+
+The gallery owns the encoding matrix; a matcher only keeps whatever index
+structure it needs and is told about row changes through ``rebuild``,
+``update``, ``move`` and ``truncate``.  ``search`` returns the ``k`` closest
+rows for each query, closest first.
+
+The backend is chosen with the ``FACE_MATCHER`` setting::
+
+    FACE_MATCHER = {
+        'BACKEND': 'attendance.matching.IVFMatcher',
+        'OPTIONS': {'nprobe': 8, 'index_path': BASE_DIR / 'face_index.npz'},
+    }
+'''
+import hashlib
+import os
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+Match = namedtuple('Match', ['employee_id', 'distance', 'margin'])
+
+
+def _top_k(distances, k):
+    'Indices of the ``k`` smallest values in each row of ``distances``, sorted.'
+    k = min(k, distances.shape[1])
+    if k < distances.shape[1]:
+        part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+    order = np.take_along_axis(distances, part, axis=1).argsort(axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def _squared_distances(queries, matrix, norms):
+    # |q - m|^2 = |q|^2 + |m|^2 - 2 q.m, one matrix product for all queries
+    distances = norms[None, :] - 2.0 * (queries @ matrix.T)
+    distances += np.einsum('ij,ij->i', queries, queries)[:, None]
+    np.maximum(distances, 0, out=distances)
+    return distances
+
+
+class BruteForceMatcher:
+    'Exact search: one vectorized distance computation against every row.'
+
+    def __init__(self, **options):
+        self._norms = np.empty(0, dtype=np.float32)
+
+    def rebuild(self, matrix):
+        self._norms = np.einsum('ij,ij->i', matrix, matrix)
+
+    def update(self, row, vector):
+        if row >= len(self._norms):
+            norms = np.empty(max(2 * len(self._norms), row + 1, 64), dtype=np.float32)
+            norms[:len(self._norms)] = self._norms
+            self._norms = norms
+        self._norms[row] = np.dot(vector, vector)
+
+    def move(self, src, dst):
+        self._norms[dst] = self._norms[src]
+
+    def truncate(self, size):
+        pass
+
+    def search(self, matrix, queries, k=2):
+        if not len(matrix):
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.int64), empty
+        distances = _squared_distances(queries, matrix, self._norms[:len(matrix)])
+        rows = _top_k(distances, k)
+        return rows, np.sqrt(np.take_along_axis(distances, rows, axis=1))
+
+
+class IVFMatcher(BruteForceMatcher):
+    '''Approximate search with an inverted-file (k-means partition) index.
+
+    Rows are bucketed by their nearest centroid and a query only scans the
+    ``nprobe`` closest buckets, so lookup cost grows with roughly
+    ``nprobe / nlist`` of the gallery.  Centroids are trained once and saved
+    to ``index_path`` (if set; a site shard's matcher gets a file of its own,
+    see ``get_matcher``); rebuilding in a new process reloads them and only
+    re-assigns rows.  Galleries smaller than ``min_size`` are searched
+    exactly.
+    '''
+
+    def __init__(self, nlist=None, nprobe=8, index_path=None, min_size=5000, train_iterations=10, seed=0, **options):
+        super().__init__(**options)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.index_path = index_path
+        self.min_size = min_size
+        self.train_iterations = train_iterations
+        self.seed = seed
+        self.centroids = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._size = 0
+        self._lists = None
+
+    def rebuild(self, matrix):
+        super().rebuild(matrix)
+        self._size = len(matrix)
+        if self.centroids is None and not self.load():
+            if not self._size or self._size < self.min_size:
+                return
+            self.train(matrix)
+            self.save()
+        self._assignments = self._assign(matrix)
+        self._lists = None
+
+    def train(self, matrix):
+        'Fit centroids with a few rounds of k-means on a sample of ``matrix``.'
+        rng = np.random.default_rng(self.seed)
+        nlist = min(self.nlist or max(1, int(np.sqrt(len(matrix)))), len(matrix))
+        sample = matrix
+        if len(matrix) > 64 * nlist:
+            sample = matrix[rng.choice(len(matrix), 64 * nlist, replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        sample_norms = np.einsum('ij,ij->i', sample, sample)
+        for _ in range(self.train_iterations):
+            labels = _squared_distances(centroids, sample, sample_norms).argmin(axis=0)
+            counts = np.bincount(labels, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        self.centroids = centroids.astype(np.float32)
+
+    def save(self):
+        if self.index_path and self.centroids is not None:
+            # pass a file object so numpy does not append its own extension
+            with open(self.index_path, 'wb') as handle:
+                np.savez(handle, centroids=self.centroids)
+
+    def load(self):
+        if not self.index_path or not os.path.exists(self.index_path):
+            return False
+        with np.load(self.index_path) as data:
+            self.centroids = data['centroids'].astype(np.float32)
+        return True
+
+    def _assign(self, vectors):
+        if self.centroids is None:
+            return np.empty(0, dtype=np.int32)
+        centroid_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        return _squared_distances(vectors, self.centroids, centroid_norms).argmin(axis=1).astype(np.int32)
+
+    def update(self, row, vector):
+        super().update(row, vector)
+        self._size = max(self._size, row + 1)
+        if self.centroids is None:
+            return
+        if row >= len(self._assignments):
+            assignments = np.empty(max(2 * len(self._assignments), row + 1, 64), dtype=np.int32)
+            assignments[:len(self._assignments)] = self._assignments
+            self._assignments = assignments
+        self._assignments[row] = self._assign(vector[None, :])[0]
+        self._lists = None
+
+    def move(self, src, dst):
+        super().move(src, dst)
+        if self.centroids is not None:
+            self._assignments[dst] = self._assignments[src]
+            self._lists = None
+
+    def truncate(self, size):
+        self._size = size
+        self._lists = None
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            assignments = self._assignments[:self._size]
+            order = np.argsort(assignments, kind='stable')
+            bounds = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    def search(self, matrix, queries, k=2):
+        if self.centroids is None or len(matrix) < self.min_size:
+            return super().search(matrix, queries, k)
+
+        order, bounds = self._inverted_lists()
+        centroid_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        probes = _top_k(_squared_distances(queries, self.centroids, centroid_norms), self.nprobe)
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf)
+        for i, query in enumerate(queries):
+            candidates = np.concatenate([order[bounds[c]:bounds[c + 1]] for c in probes[i]])
+            if not len(candidates):
+                continue
+            found = _squared_distances(query[None, :], matrix[candidates], self._norms[candidates])
+            best = _top_k(found, k)[0]
+            rows[i, :len(best)] = candidates[best]
+            distances[i, :len(best)] = np.sqrt(found[0, best])
+        return rows, distances
+
+
+def site_index_path(index_path, site):
+    '''``index_path`` for the shard of ``site``: trained on its members only, it must not replace the global index.'''
+    root, ext = os.path.splitext(str(index_path))
+    return f'{root}.site-{hashlib.sha1(site.encode()).hexdigest()[:12]}{ext}'
+
+
+def get_matcher(site=None):
+    'A new matcher for the global gallery, or for the shard of ``site``.'
+    config = getattr(settings, 'FACE_MATCHER', {})
+    backend = import_string(config.get('BACKEND', 'attendance.matching.BruteForceMatcher'))
+    options = dict(config.get('OPTIONS', {}))
+    if site is not None and options.get('index_path'):
+        options['index_path'] = site_index_path(options['index_path'], site)
+    return backend(**options)
@@ -0,0 +1,228 @@
+'''Per-stage timing and outcome metrics for the recognition views.
+
+A recognition request runs through body parse, base64 decode, image decode,
+detection, encoding (those three in an inference worker), gallery load,
+matching and the database write.  The views time each stage on a
+``Timings`` object from ``start()``, and ``Timings.finish()`` records:
+
+- ``face_recognition_stage_seconds{stage}`` and
+  ``face_recognition_request_seconds`` histograms,
+- ``face_recognition_requests_total{outcome}`` (matched, recent, no_match,
+  no_face, invalid, busy),
+- the ``face_recognition_match_distance`` histogram and the
+  ``face_recognition_gallery_size`` gauge.
+
+``metrics/`` serves them in the Prometheus text format.  The numbers are per
+process, so scrape every worker (or run one worker per target).  With
+``SERVER_TIMING`` the stage times are also sent as a ``Server-Timing``
+response header, which browser dev tools show for each kiosk request.
+
+Configured with the ``FACE_METRICS`` setting.  When both options are off
+``start()`` returns a shared no-op object, so the views pay one setting
+lookup per request.
+'''
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DISTANCE_BUCKETS = (0.1, 0.2, 0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.7, 0.8, 1.0)
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, buckets, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        # label value -> [bucket counts..., +Inf count], sum
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(label_value) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._series[label_value] = (counts, total + value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda item: item[0] or '')
+        for label_value, (counts, total) in series:
+            labels = f'{self.label}="{label_value}",' if self.label else ''
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+            labels = f'{{{labels[:-1]}}}' if labels else ''
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, help_text, label):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f'{self.name}{{{self.label}="{value}"}} {count}' for value, count in values)
+        return lines
+
+
+class Gauge:
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge', f'{self.name} {self.value}']
+
+
+stage_seconds = Histogram('face_recognition_stage_seconds', 'Time spent per recognition stage.', STAGE_BUCKETS, 'stage')
+request_seconds = Histogram('face_recognition_request_seconds', 'Total time per recognition request.', STAGE_BUCKETS)
+match_distance = Histogram('face_recognition_match_distance', 'Distance to the closest enrolled face.', DISTANCE_BUCKETS)
+requests_total = Counter('face_recognition_requests_total', 'Recognition requests by outcome.', 'outcome')
+gallery_size = Gauge('face_recognition_gallery_size', 'Encodings in the gallery (or site shard) searched by the last recognition.')
+METRICS = [requests_total, request_seconds, stage_seconds, match_distance, gallery_size]
+
+
+def render():
+    'All metrics in the Prometheus text exposition format.'
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class _Stage:
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timings.add(self.name, time.perf_counter() - self.start)
+
+
+class Timings:
+
+    def __init__(self, record=True, server_timing=False):
+        self.record = record
+        self.server_timing = server_timing
+        self.stages = {}
+        self.outcome_name = None
+        self.distance = None
+        self.start = time.perf_counter()
+
+    def stage(self, name):
+        'Context manager adding the time spent in the block to stage ``name``.'
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_worker(self, stages, wait_stage):
+        '''Add stages timed in an inference worker.
+
+        ``wait_stage`` timed the whole call, so it keeps only the time not
+        spent in the worker's stages: queueing and transfer.
+        '''
+        for name, seconds in stages.items():
+            self.add(name, seconds)
+        self.add(wait_stage, -sum(stages.values()))
+
+    def outcome(self, name, distance=None, gallery=None):
+        self.outcome_name = name
+        if distance is not None:
+            self.distance = distance
+        if gallery is not None:
+            gallery_size.set(gallery)
+
+    def finish(self, response):
+        'Record the request and add the ``Server-Timing`` header; returns ``response``.'
+        total = time.perf_counter() - self.start
+        if self.record:
+            request_seconds.observe(total)
+            for name, seconds in self.stages.items():
+                stage_seconds.observe(seconds, name)
+            if self.outcome_name:
+                requests_total.inc(self.outcome_name)
+            if self.distance is not None:
+                match_distance.observe(self.distance)
+        if self.server_timing:
+            entries = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.stages.items()]
+            entries.append(f'total;dur={total * 1000:.2f}')
+            response['Server-Timing'] = ', '.join(entries)
+        return response
+
+
+class _NullStage:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class _NullTimings:
+    'Stand-in for ``Timings`` when metrics are off; every method does nothing.'
+
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def add(self, name, seconds):
+        pass
+
+    def add_worker(self, stages, wait_stage):
+        pass
+
+    def outcome(self, name, distance=None, gallery=None):
+        pass
+
+    def finish(self, response):
+        return response
+
+
+NULL_TIMINGS = _NullTimings()
+
+
+def enabled():
+    return getattr(settings, 'FACE_METRICS', {}).get('ENABLED', False)
+
+
+def start():
+    'A ``Timings`` for one request, or ``NULL_TIMINGS`` when metrics and Server-Timing are both off.'
+    config = getattr(settings, 'FACE_METRICS', {})
+    record = config.get('ENABLED', False)
+    server_timing = config.get('SERVER_TIMING', False)
+    if not (record or server_timing):
+        return NULL_TIMINGS
+    return Timings(record, server_timing)
@@ -0,0 +1,57 @@
+import json
+import struct
+
+from django.db import migrations, models
+
+ENCODING_SIZE = 128
+HEADER = b'FE\x01f'
+
+
+def json_to_binary(apps, schema_editor):
+    EmployeeProfile = apps.get_model('attendance', 'EmployeeProfile')
+    profiles = EmployeeProfile.objects.exclude(face_encoding__isnull=True).exclude(face_encoding__exact='')
+    batch = []
+    for profile in profiles.only('pk', 'face_encoding').iterator():
+        try:
+            values = json.loads(profile.face_encoding)
+            profile.face_encoding_bin = HEADER + struct.pack(f'<{ENCODING_SIZE}f', *values)
+        except (TypeError, ValueError, struct.error):
+            continue
+        batch.append(profile)
+        if len(batch) >= 1000:
+            EmployeeProfile.objects.bulk_update(batch, ['face_encoding_bin'])
+            batch = []
+    EmployeeProfile.objects.bulk_update(batch, ['face_encoding_bin'])
+
+
+def binary_to_json(apps, schema_editor):
+    EmployeeProfile = apps.get_model('attendance', 'EmployeeProfile')
+    profiles = EmployeeProfile.objects.exclude(face_encoding_bin__isnull=True)
+    batch = []
+    for profile in profiles.only('pk', 'face_encoding_bin').iterator():
+        raw = bytes(profile.face_encoding_bin)
+        if raw[:4] != HEADER or len(raw) != len(HEADER) + 4 * ENCODING_SIZE:
+            continue
+        values = struct.unpack(f'<{ENCODING_SIZE}f', raw[len(HEADER):])
+        profile.face_encoding = json.dumps(list(values))
+        batch.append(profile)
+        if len(batch) >= 1000:
+            EmployeeProfile.objects.bulk_update(batch, ['face_encoding'])
+            batch = []
+    EmployeeProfile.objects.bulk_update(batch, ['face_encoding'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employeeprofile',
+            name='face_encoding_bin',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0002_employeeprofile_face_encoding_bin'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='employeeprofile',
+            name='face_encoding',
+        ),
+        migrations.RenameField(
+            model_name='employeeprofile',
+            old_name='face_encoding_bin',
+            new_name='face_encoding',
+        ),
+    ]
@@ -0,0 +1,63 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+
+def backfill_summaries(apps, schema_editor):
+    Attendance = apps.get_model('attendance', 'Attendance')
+    MonthlyAttendanceSummary = apps.get_model('attendance', 'MonthlyAttendanceSummary')
+    DepartmentDailySummary = apps.get_model('attendance', 'DepartmentDailySummary')
+
+    monthly_rows = (Attendance.objects.order_by()
+                    .annotate(month=TruncMonth('date'))
+                    .values_list('employee_id', 'month')
+                    .annotate(days=Count('id')))
+    MonthlyAttendanceSummary.objects.bulk_create(
+        (MonthlyAttendanceSummary(employee_id=pk, month=month, present_days=days)
+         for pk, month, days in monthly_rows.iterator()),
+        batch_size=5000,
+    )
+    daily_rows = (Attendance.objects.order_by()
+                  .values_list('employee__department', 'date')
+                  .annotate(present=Count('id')))
+    DepartmentDailySummary.objects.bulk_create(
+        (DepartmentDailySummary(department=department, date=day, present_count=present)
+         for department, day, present in daily_rows.iterator()),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0004_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepartmentDailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('department', models.CharField(blank=True, max_length=100)),
+                ('date', models.DateField()),
+                ('present_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('department', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyAttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('present_days', models.PositiveIntegerField(default=0)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='attendance.employeeprofile')),
+            ],
+            options={
+                'unique_together': {('employee', 'month')},
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
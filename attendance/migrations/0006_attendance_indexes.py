@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0005_attendance_summaries'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='attendance',
+            options={},
+        ),
+        migrations.AlterField(
+            model_name='employeeprofile',
+            name='department',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['date', 'employee'], name='attendance_date_employee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='departmentdailysummary',
+            index=models.Index(fields=['date', 'department'], name='department_summary_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlyattendancesummary',
+            index=models.Index(fields=['month', 'employee'], name='monthly_summary_month_idx'),
+        ),
+    ]
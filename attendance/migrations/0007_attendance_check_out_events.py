@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0006_attendance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='check_out_time',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='AttendanceEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('kind', models.CharField(choices=[('check_in', 'Check-in'), ('seen', 'Seen again')], max_length=20)),
+                ('source', models.CharField(blank=True, max_length=100)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='attendance.employeeprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['employee', 'timestamp'], name='attendance_event_employee_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_templates(apps, schema_editor):
+    'Each existing enrollment becomes its employee\'s first template.'
+    EmployeeProfile = apps.get_model('attendance', 'EmployeeProfile')
+    FaceTemplate = apps.get_model('attendance', 'FaceTemplate')
+    rows = EmployeeProfile.objects.exclude(face_encoding__isnull=True).values_list('pk', 'face_encoding')
+    FaceTemplate.objects.bulk_create(
+        (FaceTemplate(employee_id=pk, encoding=encoding) for pk, encoding in rows.iterator()),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0008_employeeprofile_face_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('encoding', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='face_templates', to='attendance.employeeprofile')),
+            ],
+        ),
+        migrations.RunPython(backfill_templates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0009_face_templates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Kiosk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kiosk_id', models.CharField(max_length=100, unique=True)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('site', models.CharField(blank=True, max_length=100)),
+                ('fallback_to_global', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='employeeprofile',
+            name='site',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+    ]
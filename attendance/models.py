@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -5,22 +7,138 @@ class EmployeeProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     employee_id = models.CharField(max_length=50, unique=True)
     face_image = models.ImageField(upload_to='faces/', null=True, blank=True)
-    # store face encoding as text (json list)
-    face_encoding = models.TextField(null=True, blank=True)
-    department = models.CharField(max_length=100, blank=True)
+    # sha256 of the enrolled image, lets re-enrollment skip unchanged images
+    face_image_hash = models.CharField(max_length=64, blank=True)
+    # packed float32 vector, see attendance.encoding
+    face_encoding = models.BinaryField(null=True, blank=True)
+    department = models.CharField(max_length=100, blank=True, db_index=True)
+    # kiosks at this site match against its employees first, see attendance.sites
+    site = models.CharField(max_length=100, blank=True, db_index=True)
 
     def __str__(self):
         return f'{self.user.get_full_name()} ({self.employee_id})'
 
+class Kiosk(models.Model):
+    '''A recognition kiosk, identified by the X-Kiosk-Id header it sends.'''
+    kiosk_id = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=100, blank=True)
+    # blank: match against every employee
+    site = models.CharField(max_length=100, blank=True)
+    # also search every employee when nobody at the site matches
+    fallback_to_global = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.name or self.kiosk_id
+
+class FaceTemplate(models.Model):
+    '''One enrollment sample; EmployeeProfile.face_encoding holds the centroid of an employee's templates.'''
+    employee = models.ForeignKey(EmployeeProfile, on_delete=models.CASCADE, related_name='face_templates')
+    # packed float32 vector, see attendance.encoding
+    encoding = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.employee.employee_id} - {self.created_at}'
+
 class Attendance(models.Model):
     employee = models.ForeignKey(EmployeeProfile, on_delete=models.CASCADE)
     date = models.DateField()
     check_in_time = models.TimeField(null=True, blank=True)
+    # last time the employee was seen after checking in
+    check_out_time = models.TimeField(null=True, blank=True)
     status = models.CharField(max_length=20, default='Present')
 
     class Meta:
+        # (employee, date) serves per-employee lookups; (date, employee) serves
+        # date-only and whole-company range queries.  No default ordering, so
+        # queries that need one ask for it with order_by().
         unique_together = ('employee', 'date')
-        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date', 'employee'], name='attendance_date_employee_idx'),
+        ]
 
     def __str__(self):
         return f'{self.employee.employee_id} - {self.date} - {self.status}'
+
+class AttendanceEvent(models.Model):
+    '''Append-only history of every recognition that marked attendance, written in batches by attendance.events.'''
+    CHECK_IN = 'check_in'
+    SEEN = 'seen'
+    KIND_CHOICES = [
+        (CHECK_IN, 'Check-in'),
+        (SEEN, 'Seen again'),
+    ]
+
+    employee = models.ForeignKey(EmployeeProfile, on_delete=models.CASCADE)
+    timestamp = models.DateTimeField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    source = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['employee', 'timestamp'], name='attendance_event_employee_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.employee.employee_id} - {self.timestamp} - {self.kind}'
+
+class MonthlyAttendanceSummary(models.Model):
+    '''Present days per employee per month, kept current by attendance.summaries.'''
+    employee = models.ForeignKey(EmployeeProfile, on_delete=models.CASCADE)
+    # first day of the month
+    month = models.DateField()
+    present_days = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('employee', 'month')
+        indexes = [
+            models.Index(fields=['month', 'employee'], name='monthly_summary_month_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.employee.employee_id} - {self.month:%Y-%m} - {self.present_days}'
+
+class DepartmentDailySummary(models.Model):
+    '''Employees present per department per day, kept current by attendance.summaries.'''
+    department = models.CharField(max_length=100, blank=True)
+    date = models.DateField()
+    present_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('department', 'date')
+        indexes = [
+            models.Index(fields=['date', 'department'], name='department_summary_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.department or "-"} - {self.date} - {self.present_count}'
+
+class ReportJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    requested_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    # (employee set, date range, options, attendance data version), see attendance.jobs
+    cache_key = models.CharField(max_length=64, db_index=True)
+    employee_ids = models.JSONField(default=list)
+    department = models.CharField(max_length=100, blank=True)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    charts = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    file = models.FileField(upload_to='reports/', null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.department or "employees"} {self.start_date} - {self.end_date} ({self.status})'
@@ -0,0 +1,121 @@
+'''Query-plan and query-count regression checks, run with ``manage.py check_queries``.
+
+Plan checks run ``EXPLAIN QUERY PLAN`` (SQLite only) on the queries behind
+the views, summaries and reports, and fail when one of them scans a whole
+table or index, or sorts in a temporary B-tree.  Count checks render the views
+against a small synthetic dataset and fail when a page needs more queries
+than its budget, or more queries for a bigger page (an N+1).
+'''
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+
+from .models import Attendance, DepartmentDailySummary, EmployeeProfile, MonthlyAttendanceSummary
+
+# a SCAN walks a whole table or index; every checked query should SEARCH
+FULL_SCAN = re.compile(r'\bSCAN (\w+)')
+SORT = re.compile(r'USE TEMP B-TREE FOR (?:ORDER BY|RIGHT PART OF ORDER BY)')
+
+
+def plan_queries(dates):
+    '''``{name: queryset}`` for the access paths the app relies on.'''
+    day = dates[len(dates) // 2]
+    month = day.replace(day=1)
+    page = list(EmployeeProfile.objects.order_by('employee_id').values_list('pk', flat=True)[:50])
+    department = EmployeeProfile.objects.values_list('department', flat=True).first()
+    return {
+        # dashboard and attendance list windows (attendance.caching)
+        'recent attendance window': Attendance.objects
+            .filter(employee_id__in=page, date__range=(dates[-1], dates[0]))
+            .values_list('employee_id', 'date', 'check_in_time'),
+        # mark_present
+        'existing check-ins for today': Attendance.objects
+            .filter(date=day, employee_id__in=page).values_list('employee_id', flat=True),
+        'one day, all employees': Attendance.objects.filter(date=day),
+        'date range, all employees': Attendance.objects
+            .filter(date__range=(dates[10], dates[0])).values_list('employee_id').annotate(Count('id')),
+        'one day, one department': Attendance.objects.filter(date=day, employee__department=department),
+        # attendance.reports.attendance_days
+        'department report rows': Attendance.objects
+            .filter(employee__in=EmployeeProfile.objects.filter(department=department).values('pk'),
+                    date__range=(dates[10], dates[0]))
+            .order_by('employee_id', 'date'),
+        'employee report rows': Attendance.objects.filter(employee_id=page[0], date__range=(dates[10], dates[0])),
+        'employees by department': EmployeeProfile.objects.filter(department=department),
+        'department headcount': DepartmentDailySummary.objects
+            .filter(date=day, present_count__gt=0).order_by('department'),
+        'monthly present days': MonthlyAttendanceSummary.objects.filter(employee_id=page[0], month=month),
+        'month, all employees': MonthlyAttendanceSummary.objects.filter(month=month),
+    }
+
+
+def check_plans(dates):
+    '''Yield ``(name, plan, problem)`` per query; ``problem`` is None when the plan is fine.'''
+    for name, queryset in plan_queries(dates).items():
+        plan = queryset.explain()
+        problem = None
+        scan = FULL_SCAN.search(plan)
+        if scan:
+            problem = f'full scan of {scan.group(1)}'
+        elif SORT.search(plan):
+            problem = 'sorts in a temporary B-tree'
+        yield name, plan, problem
+
+
+def analyze():
+    'Give the planner real statistics, as a long-running database would have.'
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def clear_attendance_cache():
+    caches[getattr(settings, 'ATTENDANCE_CACHE_ALIAS', 'default')].clear()
+
+
+def count_queries(func):
+    'Number of queries ``func()`` runs.'
+    # with DEBUG on, the bounded query log may already be full from populating
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+def _count_view_queries(client, url):
+    def get():
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        if response.status_code != 200:
+            raise AssertionError(f'{url} returned {response.status_code}')
+
+    # measure the cold path; a warm cache would hide regressions
+    clear_attendance_cache()
+    return count_queries(get)
+
+
+def check_counts(client, employee, dates):
+    '''Yield ``(name, count, budget, problem)`` for each view.'''
+    start, end = dates[-1], dates[0]
+    budgets = {
+        'dashboard': ('/dashboard/', 6),
+        'attendance list, 10 per page': ('/attendance-list/?per_page=10', 8),
+        'attendance list, 100 per page': ('/attendance-list/?per_page=100', 8),
+        'attendance list, streamed': ('/attendance-list/?per_page=500', 8),
+        'employee excel export': (f'/attendance-download/?employee_id={employee.pk}'
+                                  f'&start_date={start}&end_date={end}', 5),
+        'bulk excel export': (f'/attendance-download/bulk/?start_date={end - timedelta(days=6)}'
+                              f'&end_date={end}', 8),
+    }
+    counts = {}
+    for name, (url, budget) in budgets.items():
+        counts[name] = count = _count_view_queries(client, url)
+        problem = f'over budget of {budget}' if count > budget else None
+        if name.startswith('attendance list') and count != counts['attendance list, 10 per page']:
+            problem = 'query count grows with page size'
+        yield name, count, budget, problem
@@ -0,0 +1,89 @@
+'''Short-lived memory of recent matches per kiosk.
+
+Someone standing in front of a kiosk sends many captures in a few seconds.
+After the first one is matched and marked, ``RecentMatches`` remembers the
+encoding, and later encodings from the same kiosk that fall within the
+entry's radius are answered from memory, with no gallery search, ORM query
+or write.
+
+The radius is what keeps this exact.  An entry matched employee A at
+distance ``d``, and the runner-up was ``margin`` further away.  Its radius is
+``min(RADIUS, margin / 2, tolerance - d)``.  By the triangle inequality, any
+encoding within that radius is still within ``tolerance`` of A and no
+further from A than from the runner-up, so a full search would return A too.
+Enrolment changes clear every entry (see ``attendance.signals``).
+
+Configured with the ``FACE_RECENT_MATCHES`` setting; ``TTL = 0`` disables it.
+'''
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+
+RecentMatch = namedtuple('RecentMatch', ['encoding', 'radius', 'day', 'expires', 'employee', 'first_name'])
+
+
+class RecentMatches:
+
+    def __init__(self, ttl=10.0, max_entries=256, radius=0.2):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.radius = radius
+        self.hits = 0
+        self.misses = 0
+        # (kiosk, employee pk) -> RecentMatch, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, kiosk, encoding):
+        '''The remembered match for ``encoding`` at ``kiosk``, or None.'''
+        if not self.ttl:
+            return None
+        encoding = np.asarray(encoding, dtype=np.float32)
+        now = time.monotonic()
+        today = date.today()
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.expires <= now or entry.day != today:
+                    del self._entries[key]
+                elif key[0] == kiosk and np.linalg.norm(encoding - entry.encoding) <= entry.radius:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+        return None
+
+    def remember(self, kiosk, encoding, match, employee, first_name, tolerance):
+        'Remember a match that was just marked present, if it is unambiguous enough to reuse.'
+        if not self.ttl:
+            return
+        radius = min(self.radius, match.margin / 2, tolerance - match.distance)
+        if radius <= 0:
+            return
+        entry = RecentMatch(np.array(encoding, dtype=np.float32), radius, date.today(),
+                            time.monotonic() + self.ttl, employee, first_name)
+        with self._lock:
+            self._entries[(kiosk, match.employee_id)] = entry
+            self._entries.move_to_end((kiosk, match.employee_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_recent = None
+_recent_lock = threading.Lock()
+
+
+def get_recent_matches():
+    global _recent
+    with _recent_lock:
+        if _recent is None:
+            config = getattr(settings, 'FACE_RECENT_MATCHES', {})
+            _recent = RecentMatches(config.get('TTL', 10.0), config.get('MAX_ENTRIES', 256), config.get('RADIUS', 0.2))
+        return _recent
@@ -0,0 +1,124 @@
+'''Attendance spreadsheet exports for many employees.
+
+Workbooks are built with openpyxl's write-only mode: rows are streamed to
+disk as they are appended and database rows are read with ``.iterator()``,
+so memory stays flat no matter how many employees or days are exported.
+'''
+from datetime import timedelta
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.chart import BarChart, PieChart, Reference
+from openpyxl.styles import Font
+
+from .models import Attendance
+
+HEADERS = [
+    'Employee Name',
+    'Employee ID',
+    'Department',
+    'Date',
+    'Check-in Time',
+    'Status',
+    'Status Value'
+]
+SUMMARY_HEADERS = ['Employee Name', 'Employee ID', 'Department', 'Present', 'Absent']
+CHUNK_SIZE = 2000
+
+
+def _header_row(sheet, headers):
+    bold = Font(bold=True)
+    row = []
+    for title in headers:
+        cell = WriteOnlyCell(sheet, value=title)
+        cell.font = bold
+        row.append(cell)
+    return row
+
+
+def attendance_days(employees, start_date, end_date):
+    '''Yield ``(employee, date, check_in_time_or_None, present)`` for every employee and day.
+
+    ``employees`` is an EmployeeProfile queryset; employees and their
+    attendance rows are both read in primary-key order and merged, so only
+    one chunk of each is in memory at a time.
+    '''
+    total_days = (end_date - start_date).days + 1
+    all_dates = [start_date + timedelta(days=i) for i in range(total_days)]
+    records = iter(Attendance.objects
+                   .filter(employee__in=employees.values('pk'), date__range=(start_date, end_date))
+                   .order_by('employee_id', 'date')
+                   .values_list('employee_id', 'date', 'check_in_time')
+                   .iterator(chunk_size=CHUNK_SIZE))
+    pending = next(records, None)
+
+    for employee in employees.select_related('user').order_by('pk').iterator(chunk_size=CHUNK_SIZE):
+        # skip rows of employees that are no longer in the queryset
+        while pending is not None and pending[0] < employee.pk:
+            pending = next(records, None)
+        check_ins = {}
+        while pending is not None and pending[0] == employee.pk:
+            check_ins[pending[1]] = pending[2]
+            pending = next(records, None)
+        for current_date in all_dates:
+            present = current_date in check_ins
+            yield employee, current_date, check_ins.get(current_date), present
+
+
+def write_attendance_workbook(output, employees, start_date, end_date, charts=False):
+    '''Write a multi-employee attendance report to the file object ``output``.
+
+    The first sheet has one row per employee and day, the second one summary
+    row per employee.  ``charts`` adds a present/absent pie and a per-employee
+    bar chart on the summary sheet.
+    '''
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Attendance Report')
+    sheet.append(_header_row(sheet, HEADERS))
+
+    summaries = []
+    current = None
+    for employee, current_date, check_in_time, present in attendance_days(employees, start_date, end_date):
+        if current is None or current[0] is not employee:
+            current = [employee, 0, 0]
+            summaries.append(current)
+        current[1 if present else 2] += 1
+        sheet.append([
+            employee.user.get_full_name(),
+            employee.employee_id,
+            employee.department,
+            current_date.strftime('%Y-%m-%d'),
+            check_in_time.strftime('%H:%M:%S') if check_in_time else '',
+            'Present' if present else 'Absent',
+            1 if present else 0
+        ])
+
+    summary = workbook.create_sheet('Summary')
+    summary.append(_header_row(summary, SUMMARY_HEADERS))
+    total_present = total_absent = 0
+    for employee, present_count, absent_count in summaries:
+        total_present += present_count
+        total_absent += absent_count
+        summary.append([employee.user.get_full_name(), employee.employee_id, employee.department,
+                        present_count, absent_count])
+    summary.append([])
+    totals_row = len(summaries) + 3
+    summary.append(['Total Present', total_present])
+    summary.append(['Total Absent', total_absent])
+
+    if charts and summaries:
+        pie = PieChart()
+        pie.title = 'Attendance Distribution'
+        pie.add_data(Reference(summary, min_col=2, min_row=totals_row, max_row=totals_row + 1), titles_from_data=False)
+        pie.set_categories(Reference(summary, min_col=1, min_row=totals_row, max_row=totals_row + 1))
+        summary.add_chart(pie, 'H2')
+
+        bar = BarChart()
+        bar.title = 'Present Days per Employee'
+        bar.y_axis.title = 'Days'
+        bar.x_axis.title = 'Employee'
+        bar.add_data(Reference(summary, min_col=4, min_row=1, max_row=len(summaries) + 1), titles_from_data=True)
+        bar.set_categories(Reference(summary, min_col=2, min_row=2, max_row=len(summaries) + 1))
+        summary.add_chart(bar, 'H20')
+
+    workbook.save(output)
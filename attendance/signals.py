@@ -0,0 +1,64 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching
+from .gallery import invalidate, remove_employee
+from .recent import get_recent_matches
+from .models import Attendance, EmployeeProfile, Kiosk
+
+
+@receiver(pre_save, sender=EmployeeProfile)
+def remember_previous_site(sender, instance, **kwargs):
+    # the shard an employee leaves has to reload in every process too
+    instance._previous_site = (EmployeeProfile.objects.filter(pk=instance.pk).values_list('site', flat=True).first()
+                               if instance.pk else None)
+
+
+@receiver(post_save, sender=EmployeeProfile)
+def update_gallery_on_save(sender, instance, **kwargs):
+    # bumped after commit, so the reload also sees templates saved in the same transaction
+    invalidate({getattr(instance, '_previous_site', None), instance.site})
+
+
+@receiver(post_delete, sender=EmployeeProfile)
+def update_gallery_on_delete(sender, instance, **kwargs):
+    remove_employee(instance.pk)
+    invalidate({instance.site})
+
+
+@receiver(post_save, sender=EmployeeProfile)
+@receiver(post_delete, sender=EmployeeProfile)
+def forget_recent_matches(sender, instance, **kwargs):
+    # a new or changed encoding may now be closer than a remembered match
+    get_recent_matches().clear()
+
+
+@receiver(post_save, sender=EmployeeProfile)
+@receiver(post_delete, sender=EmployeeProfile)
+def invalidate_profile_cache(sender, instance, **kwargs):
+    caching.bump('profiles', f'employee:{instance.pk}')
+
+
+@receiver(post_save, sender=User)
+def invalidate_renamed_employee(sender, instance, update_fields=None, **kwargs):
+    # listings and reports show the user's name; logging in only saves last_login
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    profile_pk = EmployeeProfile.objects.filter(user=instance).values_list('pk', flat=True).first()
+    if profile_pk:
+        caching.bump('profiles', f'employee:{profile_pk}')
+
+
+@receiver(post_save, sender=Kiosk)
+@receiver(post_delete, sender=Kiosk)
+def invalidate_kiosk_cache(sender, instance, **kwargs):
+    caching.bump('kiosks')
+    # remembered matches came from the kiosk's old shard
+    get_recent_matches().clear()
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def invalidate_attendance_cache(sender, instance, **kwargs):
+    caching.bump(f'employee:{instance.employee_id}', 'headcount')
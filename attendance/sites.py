@@ -0,0 +1,88 @@
+'''Per-site recognition: kiosks match against their site's employees first.
+
+A ``Kiosk`` (identified by the ``X-Kiosk-Id`` header) with a ``site`` is
+matched against the gallery shard of the employees whose
+``EmployeeProfile.site`` is that site, so the cost of a search grows with
+the site rather than the company, and someone at another site cannot be a
+false match.  With ``fallback_to_global`` a capture that matches nobody at
+the site is searched again in the global gallery (a visitor from another
+site).  Requests from unknown kiosks, or kiosks without a site, use the
+global gallery as before.
+
+Each shard is a ``FaceGallery`` of its own, loaded on first use and updated
+only when one of its members changes (see ``gallery.invalidate``).
+Kiosk settings are read through the versioned cache in
+``attendance.caching`` and invalidated when a kiosk is saved.
+'''
+import hashlib
+
+import numpy as np
+from django.conf import settings
+
+from . import caching
+from .coalesce import get_coalescer
+from .gallery import get_gallery
+
+
+def get_kiosk(kiosk_id):
+    '''``{'site': ..., 'fallback_to_global': ...}`` for a registered kiosk, or None.'''
+    from .models import Kiosk
+
+    if not kiosk_id:
+        return None
+    key = 'kiosk:' + hashlib.sha1(kiosk_id.encode()).hexdigest()
+    return caching.cached(key, ['kiosks'], lambda: Kiosk.objects.filter(kiosk_id=kiosk_id)
+                          .values('site', 'fallback_to_global').first())
+
+
+def galleries_for(kiosk_id):
+    'Galleries to search for a capture from ``kiosk_id``, in order.'
+    kiosk = get_kiosk(kiosk_id)
+    if not kiosk or not kiosk['site']:
+        return [get_gallery()]
+    shard = get_gallery(kiosk['site'])
+    return [shard, get_gallery()] if kiosk['fallback_to_global'] else [shard]
+
+
+def _merge(match, fallback, tolerance):
+    'The fallback match for a capture whose shard ``match`` was not within ``tolerance``.'
+    if not fallback or fallback.distance > tolerance:
+        return match
+    if match:
+        # the shard is searched first, so a capture near this one could still
+        # match there; keep the recent-match radius (margin / 2) short of that
+        fallback = fallback._replace(margin=min(fallback.margin, 2 * (match.distance - tolerance)))
+    return fallback
+
+
+def match_many(galleries, vectors, tolerance=None):
+    '''Closest employee for each row of ``vectors``, from the first gallery that has one within ``tolerance``.
+
+    Rows without a match anywhere keep the closest candidate of the first
+    gallery (or None).
+    '''
+    tolerance = settings.FACE_MATCH_TOLERANCE if tolerance is None else tolerance
+    vectors = np.asarray(vectors, dtype=np.float32)
+    matches = galleries[0].match_many(vectors)
+    for gallery in galleries[1:]:
+        pending = [i for i, match in enumerate(matches) if not match or match.distance > tolerance]
+        if not pending:
+            break
+        for i, fallback in zip(pending, gallery.match_many(vectors[pending])):
+            matches[i] = _merge(matches[i], fallback, tolerance)
+    return matches
+
+
+def match(galleries, vector, tolerance=None):
+    return match_many(galleries, np.asarray(vector, dtype=np.float32)[None, :], tolerance)[0]
+
+
+async def amatch(galleries, vector, tolerance=None):
+    'Like ``match``, through the per-gallery ``MatchCoalescer`` of the running loop.'
+    tolerance = settings.FACE_MATCH_TOLERANCE if tolerance is None else tolerance
+    result = await get_coalescer(galleries[0]).match(vector)
+    for gallery in galleries[1:]:
+        if result and result.distance <= tolerance:
+            break
+        result = _merge(result, await get_coalescer(gallery).match(vector), tolerance)
+    return result
@@ -20,6 +20,122 @@ async function captureImage() {
   return dataUrl;
 }
 
+// Capture the current frame as an encoded image Blob (JPEG by default) that
+// can be POSTed as-is, about a quarter the size of a base64 PNG data URL.
+async function captureBlob(type = 'image/jpeg', quality = 0.85) {
+  startWebcam();
+  const video = document.getElementById('video');
+  const canvas = document.getElementById('canvas');
+  canvas.getContext('2d').drawImage(video, 0, 0, canvas.width, canvas.height);
+  return new Promise(resolve => canvas.toBlob(resolve, type, quality));
+}
+
+// Opt-in shrinking before upload, configured by data attributes on <video>:
+//   data-max-dimension  longest side of the uploaded frame, in pixels
+//   data-jpeg-quality   JPEG quality between 0 and 1
+//   data-face-crop      crop to the face where the browser has FaceDetector
+// Resolves to {blob, faceBox}; faceBox is [top, right, bottom, left] in the
+// uploaded image's pixels (sent as the X-Face-Box hint) or null.
+async function captureUpload() {
+  startWebcam();
+  const video = document.getElementById('video');
+  const options = video.dataset;
+  const maxDimension = parseInt(options.maxDimension || '0', 10);
+  const quality = parseFloat(options.jpegQuality || '0.85');
+  if (!maxDimension && !options.faceCrop) {
+    return {blob: await captureBlob('image/jpeg', quality), faceBox: null};
+  }
+
+  const width = video.videoWidth || video.width;
+  const height = video.videoHeight || video.height;
+  let sx = 0, sy = 0, sw = width, sh = height;
+  let face = null;
+  if (options.faceCrop && 'FaceDetector' in window) {
+    try {
+      const detected = await new FaceDetector({maxDetectedFaces: 1}).detect(video);
+      if (detected.length) {
+        const box = detected[0].boundingBox;
+        const margin = 0.4 * Math.max(box.width, box.height);
+        sx = Math.max(0, box.x - margin);
+        sy = Math.max(0, box.y - margin);
+        sw = Math.min(width, box.x + box.width + margin) - sx;
+        sh = Math.min(height, box.y + box.height + margin) - sy;
+        face = [box.y - sy, box.x + box.width - sx, box.y + box.height - sy, box.x - sx];
+      }
+    } catch (err) {
+      // detection is only an optimisation; fall back to the whole frame
+    }
+  }
+
+  const scale = maxDimension ? Math.min(1, maxDimension / Math.max(sw, sh)) : 1;
+  const canvas = document.createElement('canvas');
+  canvas.width = Math.round(sw * scale);
+  canvas.height = Math.round(sh * scale);
+  canvas.getContext('2d').drawImage(video, sx, sy, sw, sh, 0, 0, canvas.width, canvas.height);
+  const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', quality));
+  return {blob, faceBox: face && face.map(value => Math.round(value * scale))};
+}
+
+// Short-burst recognition (see attendance.burst): capture up to `frames`
+// frames `interval` ms apart and POST them as one body of frames, each a
+// 4-byte big-endian length followed by the JPEG.  Where the browser can
+// stream request bodies the frames are sent as they are captured and
+// capturing stops once the server has answered; otherwise they are sent
+// together once all are captured.  Resolves to the fetch Response.
+async function recognizeBurst(url, frames, interval, headers) {
+  const encodeFrame = async () => {
+    const bytes = new Uint8Array(await (await captureUpload()).blob.arrayBuffer());
+    const frame = new Uint8Array(4 + bytes.length);
+    new DataView(frame.buffer).setUint32(0, bytes.length);
+    frame.set(bytes, 4);
+    return frame;
+  };
+  const pause = () => new Promise(resolve => setTimeout(resolve, interval));
+  headers = Object.assign({'Content-Type': 'application/octet-stream'}, headers);
+
+  if (supportsRequestStreams()) {
+    let answered = false;
+    let sent = 0;
+    const body = new ReadableStream({
+      async pull(controller) {
+        if (answered || sent >= frames) {
+          controller.close();
+          return;
+        }
+        if (sent) await pause();
+        controller.enqueue(await encodeFrame());
+        sent += 1;
+      }
+    });
+    try {
+      const response = await fetch(url, {method: 'POST', headers, body, duplex: 'half'});
+      answered = true;
+      return response;
+    } catch (err) {
+      // streamed uploads need HTTP/2; send the burst in one piece instead
+    }
+  }
+  const parts = [];
+  for (let i = 0; i < frames; i++) {
+    if (i) await pause();
+    parts.push(await encodeFrame());
+  }
+  return fetch(url, {method: 'POST', headers, body: new Blob(parts)});
+}
+
+function supportsRequestStreams() {
+  let duplexAccessed = false;
+  const hasContentType = new Request('', {
+    body: new ReadableStream(),
+    method: 'POST',
+    get duplex() {
+      duplexAccessed = true;
+      return 'half';
+    }
+  }).headers.has('Content-Type');
+  return duplexAccessed && !hasContentType;
+}
+
 function getCookie(name) {
   const value = '; ' + document.cookie;
   const parts = value.split('; ' + name + '=');
@@ -0,0 +1,108 @@
+'''Materialized attendance counts.
+
+``MonthlyAttendanceSummary`` and ``DepartmentDailySummary`` are incremented by
+``record_check_ins`` whenever new attendance rows are marked, so dashboards
+and reports read one row instead of counting ``Attendance``.  ``rebuild``
+recomputes them from ``Attendance`` for backfills and imports (see the
+``rebuild_attendance_summaries`` command).
+'''
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+
+from .models import Attendance, DepartmentDailySummary, EmployeeProfile, MonthlyAttendanceSummary
+
+
+def record_check_ins(employee_ids, day):
+    'Count one more present day for each profile pk in ``employee_ids`` (new rows only).'
+    employee_ids = list(employee_ids)
+    if not employee_ids:
+        return
+    month = day.replace(day=1)
+    departments = Counter(EmployeeProfile.objects
+                          .filter(pk__in=employee_ids)
+                          .values_list('department', flat=True))
+
+    with transaction.atomic():
+        MonthlyAttendanceSummary.objects.bulk_create(
+            [MonthlyAttendanceSummary(employee_id=pk, month=month) for pk in employee_ids],
+            ignore_conflicts=True,
+        )
+        (MonthlyAttendanceSummary.objects
+         .filter(employee_id__in=employee_ids, month=month)
+         .update(present_days=F('present_days') + 1))
+
+        DepartmentDailySummary.objects.bulk_create(
+            [DepartmentDailySummary(department=department, date=day) for department in departments],
+            ignore_conflicts=True,
+        )
+        for department, count in departments.items():
+            (DepartmentDailySummary.objects
+             .filter(department=department, date=day)
+             .update(present_count=F('present_count') + count))
+
+
+def _month_end(day):
+    next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+def rebuild(start_date=None, end_date=None, batch_size=5000):
+    '''Recompute summaries from Attendance, everywhere or for a date range.
+
+    Monthly rows are rebuilt for every month the range touches, so for them
+    the range is widened to whole months.
+    '''
+    daily_range = {}
+    monthly_range = {}
+    if start_date:
+        daily_range['date__gte'] = start_date
+        monthly_range['date__gte'] = start_date.replace(day=1)
+    if end_date:
+        daily_range['date__lte'] = end_date
+        monthly_range['date__lte'] = _month_end(end_date)
+    month_filter = {key.replace('date', 'month'): value for key, value in monthly_range.items()}
+
+    with transaction.atomic():
+        MonthlyAttendanceSummary.objects.filter(**month_filter).delete()
+        monthly_rows = (Attendance.objects
+                        .filter(**monthly_range)
+                        .order_by()
+                        .annotate(month=TruncMonth('date'))
+                        .values_list('employee_id', 'month')
+                        .annotate(days=Count('id')))
+        MonthlyAttendanceSummary.objects.bulk_create(
+            (MonthlyAttendanceSummary(employee_id=pk, month=month, present_days=days)
+             for pk, month, days in monthly_rows.iterator()),
+            batch_size=batch_size,
+        )
+
+        DepartmentDailySummary.objects.filter(**daily_range).delete()
+        daily_rows = (Attendance.objects
+                      .filter(**daily_range)
+                      .order_by()
+                      .values_list('employee__department', 'date')
+                      .annotate(present=Count('id')))
+        DepartmentDailySummary.objects.bulk_create(
+            (DepartmentDailySummary(department=department, date=day, present_count=present)
+             for department, day, present in daily_rows.iterator()),
+            batch_size=batch_size,
+        )
+
+
+def monthly_present_days(employee, month):
+    return (MonthlyAttendanceSummary.objects
+            .filter(employee=employee, month=month.replace(day=1))
+            .values_list('present_days', flat=True)
+            .first()) or 0
+
+
+def department_headcount(day):
+    '''``{department: present_count}`` for one day.'''
+    return dict(DepartmentDailySummary.objects
+                .filter(date=day, present_count__gt=0)
+                .order_by('department')
+                .values_list('department', 'present_count'))
@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipUnless
+
+import numpy as np
+from django.db import close_old_connections, connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+
+from . import events, marking, querychecks, summaries
+from .benchmarks import populate_attendance
+from .models import Attendance, AttendanceEvent, DepartmentDailySummary, EmployeeProfile, MonthlyAttendanceSummary
+
+
+class QueryRegressionTests(TestCase):
+    '''The checks of ``manage.py check_queries``, so a full scan or an N+1 fails the test run.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dates = populate_attendance(300, 30)
+        summaries.rebuild()
+        cls.employee = EmployeeProfile.objects.select_related('user').order_by('pk').first()
+        cls.employee.user.is_staff = True
+        cls.employee.user.save(update_fields=['is_staff'])
+        querychecks.analyze()
+
+    def setUp(self):
+        self.client.force_login(self.employee.user)
+
+    @skipUnless(connection.vendor == 'sqlite', 'plan checks need SQLite')
+    def test_query_plans(self):
+        for name, plan, problem in querychecks.check_plans(self.dates):
+            with self.subTest(name):
+                self.assertIsNone(problem, plan)
+
+    def test_query_counts(self):
+        for name, count, budget, problem in querychecks.check_counts(self.client, self.employee, self.dates):
+            with self.subTest(name):
+                self.assertIsNone(problem, f'{count} queries (budget {budget})')
+
+
+class MarkingRaceTests(TransactionTestCase):
+    '''Threads marking overlapping employees at once: one row, one summary count and one event per sighting.'''
+
+    threads = 8
+
+    def setUp(self):
+        populate_attendance(20, 0)
+        self.employee_ids = list(EmployeeProfile.objects.values_list('pk', flat=True))
+
+    def race(self):
+        rng = np.random.default_rng(0)
+        # every post sees 1-4 people from a small group, so most posts collide
+        batches = [[int(pk) for pk in rng.choice(self.employee_ids[:10], rng.integers(1, 5), replace=False)]
+                   for _ in range(self.threads * 5)]
+        start_barrier = threading.Barrier(self.threads)
+
+        def post(batch_index):
+            if batch_index < self.threads:
+                start_barrier.wait()
+            try:
+                return marking.mark_present(batches[batch_index], source=f'kiosk-{batch_index % 4}')
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            created = list(pool.map(post, range(len(batches))))
+        events.flush()
+
+        expected = {pk for batch in batches for pk in batch}
+        self.assertEqual(Attendance.objects.count(), len(expected))
+        self.assertEqual(sum(len(pks) for pks in created), len(expected))
+        self.assertEqual(MonthlyAttendanceSummary.objects.aggregate(total=Sum('present_days'))['total'], len(expected))
+        self.assertEqual(DepartmentDailySummary.objects.aggregate(total=Sum('present_count'))['total'], len(expected))
+        self.assertEqual(AttendanceEvent.objects.filter(kind=AttendanceEvent.CHECK_IN).count(), len(expected))
+        self.assertEqual(AttendanceEvent.objects.count(), sum(len(batch) for batch in batches))
+
+    def test_insert_returning(self):
+        if not marking._supports_insert_returning():
+            self.skipTest(f'{connection.vendor} has no INSERT ... RETURNING')
+        self.race()
+
+    def test_row_by_row_fallback(self):
+        with mock.patch.object(marking, '_supports_insert_returning', return_value=False):
+            self.race()
@@ -9,6 +9,16 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('dashboard/', views.dashboard_view, name='dashboard'),
     path('recognize/', views.recognize_view, name='recognize'),
+    path('recognize/async/', views.recognize_async_view, name='recognize_async'),
+    path('recognize/batch/', views.recognize_batch_view, name='recognize_batch'),
+    path('recognize/burst/', views.recognize_burst_view, name='recognize_burst'),
     path('attendance-list/', views.attendance_list_view, name='attendance_list'),
     path('attendance-download/', views.download_attendance_excel, name='attendance_download'),
+    path('attendance-download/bulk/', views.download_attendance_bulk_excel, name='attendance_download_bulk'),
+    path('cache-stats/', views.cache_stats_view, name='cache_stats'),
+    path('ready/', views.ready_view, name='ready'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('reports/', views.report_create_view, name='report_create'),
+    path('reports/<uuid:job_id>/', views.report_status_view, name='report_status'),
+    path('reports/<uuid:job_id>/download/', views.report_download_view, name='report_download'),
 ]
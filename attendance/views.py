@@ -1,32 +1,75 @@
 import base64
+import hashlib
 import io
 import json
+import tempfile
+from collections import deque
 from datetime import date, datetime, timedelta
-from django.shortcuts import render, redirect
+from django.conf import settings
+from django.shortcuts import get_object_or_404, render, redirect
+from django.urls import reverse
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpResponse
+from django.views.decorators.http import require_POST
+from django.core.paginator import Page, Paginator
+from django.http import FileResponse, Http404, JsonResponse, HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.core.files.base import ContentFile
+from asgiref.sync import sync_to_async
 from openpyxl import Workbook
 from openpyxl.chart import PieChart, Reference, BarChart
 from openpyxl.styles import Font
 from .forms import EmployeeSignUpForm, LoginForm
-from .models import EmployeeProfile, Attendance
-
-# try/import face_recognition but fail gracefully if not installed
-try:
-    import face_recognition
-    import numpy as np
-except Exception as exc:
-    face_recognition = None
+from .encoding import pack_encoding
+from . import burst, caching, enrollment, faces, metrics, sites
+from .recent import get_recent_matches
+from .warmup import get_warmup
+from .inference import InferenceUnavailable, get_detection_profile, get_enrollment_quality, get_inference
+from .marking import amark_present, mark_present
+from .jobs import fail_if_file_missing, fail_if_lost, submit_report
+from .models import EmployeeProfile, Attendance, ReportJob
+from .reports import write_attendance_workbook
+from .summaries import department_headcount, monthly_present_days
+
+import numpy as np
 
 def home_view(request):
     return redirect('login')
 
 from django.contrib.auth.decorators import login_required
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+
+def _check_enrollment_image(image_data):
+    '''``(encoding, problem)`` for an enrollment image, decoded and checked in memory on the inference pool.'''
+    try:
+        return get_inference().run(faces.check_enrollment, image_data,
+                                   get_detection_profile('enrollment'), get_enrollment_quality())
+    except OSError:
+        return None, 'Invalid image'
+
+def _save_enrollment(profile, image_data, encodings):
+    '''Write the face image, its hash and encodings with one profile save in one transaction.
+
+    ``encodings`` are added as templates and the profile's encoding becomes
+    their centroid (see ``attendance.enrollment``).  The image file is
+    removed again if the database write fails.
+    '''
+    with transaction.atomic():
+        if image_data:
+            profile.face_image.save(f'face_{profile.employee_id}.png', ContentFile(image_data), save=False)
+            profile.face_image_hash = hashlib.sha256(image_data).hexdigest()
+        if encodings:
+            profile.face_encoding = pack_encoding(enrollment.centroids([(profile, encodings)])[0])
+        try:
+            profile.save()
+            if encodings:
+                enrollment.store_templates([(profile, encodings)])
+        except Exception:
+            if image_data:
+                profile.face_image.delete(save=False)
+            raise
 
 def register_view(request):
     # CASE 1: Logged-in user → complete profile only
@@ -38,31 +81,26 @@ def register_view(request):
             department = request.POST.get('department')
             face_image_data = request.POST.get('face_image_data')
 
-            profile, created = EmployeeProfile.objects.get_or_create(
-                user=user,
-                defaults={
-                    'employee_id': employee_id,
-                    'department': department
-                }
-            )
-
-            if not created:
-                profile.employee_id = employee_id
-                profile.department = department
-
+            image_data = None
+            encodings = []
             if face_image_data:
-                header, encoded = face_image_data.split(',', 1)
-                image_data = base64.b64decode(encoded)
-                file_name = f'face_{employee_id}.png'
-                profile.face_image.save(file_name, ContentFile(image_data), save=True)
-
-                if face_recognition:
-                    image = face_recognition.load_image_file(profile.face_image.path)
-                    encodings = face_recognition.face_encodings(image)
-                    if encodings:
-                        profile.face_encoding = json.dumps(encodings[0].tolist())
-
-            profile.save()
+                image_data = _decode_data_url(face_image_data)
+                if faces.available():
+                    # check and encode before anything is written
+                    try:
+                        encoding, problem = _check_enrollment_image(image_data)
+                    except InferenceUnavailable as exc:
+                        response = render(request, 'register.html', {'profile_only': True, 'error': str(exc)}, status=503)
+                        response['Retry-After'] = str(exc.retry_after)
+                        return response
+                    if problem:
+                        return render(request, 'register.html', {'profile_only': True, 'error': problem}, status=400)
+                    encodings = [encoding]
+
+            profile = EmployeeProfile.objects.filter(user=user).first() or EmployeeProfile(user=user)
+            profile.employee_id = employee_id
+            profile.department = department
+            _save_enrollment(profile, image_data, encodings)
             return redirect('dashboard')
 
         return render(request, 'register.html', {'profile_only': True})
@@ -100,27 +138,32 @@ def register_view(request):
     return render(request, 'register.html', {'form': form})
 
 def register_face_view(request):
-    # simplified separate endpoint to register only face for existing user
+    # simplified separate endpoint to register only face for existing user;
+    # each face_data capture becomes one more enrollment template
     if request.method == 'POST':
         username = request.POST.get('username')
-        face_data = request.POST.get('face_data')
+        face_data = request.POST.getlist('face_data')
         try:
             user = User.objects.get(username=username)
             profile = EmployeeProfile.objects.get(user=user)
         except Exception:
             return JsonResponse({'status': 'error', 'message': 'User not found'}, status=404)
-        header, encoded = face_data.split(',', 1)
-        image_data = base64.b64decode(encoded)
-        file_name = f'face_{profile.employee_id}.png'
-        profile.face_image.save(file_name, ContentFile(image_data), save=True)
-
-        if face_recognition:
-            image = face_recognition.load_image_file(profile.face_image.path)
-            encodings = face_recognition.face_encodings(image)
-            if encodings:
-                profile.face_encoding = json.dumps(encodings[0].tolist())
-                profile.save()
-        return JsonResponse({'status': 'ok'})
+        if not face_data:
+            return JsonResponse({'status': 'error', 'message': 'No image provided'}, status=400)
+        captures = [_decode_data_url(data_url) for data_url in face_data]
+        encodings = []
+        if faces.available():
+            for index, image_data in enumerate(captures):
+                try:
+                    encoding, problem = _check_enrollment_image(image_data)
+                except InferenceUnavailable as exc:
+                    return _busy_response(exc)
+                if problem:
+                    message = f'Capture {index + 1}: {problem}' if len(captures) > 1 else problem
+                    return JsonResponse({'status': 'error', 'message': message}, status=400)
+                encodings.append(encoding)
+        _save_enrollment(profile, captures[0], encodings)
+        return JsonResponse({'status': 'ok', 'templates': profile.face_templates.count()})
     return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
 
 def login_view(request):
@@ -161,24 +204,15 @@ def dashboard_view(request):
         # Generate last N dates (including today)
         recent_dates = [today - timedelta(days=day) for day in range(number_of_days)]
 
-        # Fetch existing attendance records for the employee
-        existing_records = Attendance.objects.filter(
-            employee=profile,
-            date__in=recent_dates
-        )
-
-        # Map records by date for fast lookup
-        attendance_by_date = {
-            record.date: record for record in existing_records
-        }
+        # Existing attendance for the employee by date, cached until it changes
+        attendance_by_date = caching.recent_attendance([profile.pk], recent_dates)[profile.pk]
 
         # Build final attendance list (Present + Absent)
         for current_date in recent_dates:
             if current_date in attendance_by_date:
-                record = attendance_by_date[current_date]
                 attendance_entries.append({
                     'date': current_date,
-                    'check_in_time': record.check_in_time,
+                    'check_in_time': attendance_by_date[current_date],
                     'status': 'Present'
                 })
             else:
@@ -190,65 +224,377 @@ def dashboard_view(request):
 
     return render(request, 'dashboard.html', {
         'profile': profile,
-        'attendance_entries': attendance_entries
+        'attendance_entries': attendance_entries,
+        'present_this_month': caching.cached(f'month:{profile.pk}:{today:%Y-%m}', [f'employee:{profile.pk}'],
+                                             lambda: monthly_present_days(profile, today)),
+        'capture': settings.FACE_CAPTURE,
     })
 
 
+def _decode_data_url(data_url):
+    'Raw image bytes from a base64 ``data:image/...`` URL.'
+    header, encoded = data_url.split(',', 1)
+    return base64.b64decode(encoded)
+
+def _read_image_upload(request, timings=metrics.NULL_TIMINGS):
+    '''Image bytes from a recognition request, or None if there is none.
+
+    Accepts, cheapest first: a raw ``image/*`` or ``application/octet-stream``
+    body, a ``multipart/form-data`` file field named ``image``, or the legacy
+    JSON ``{"image": data_url}`` body.
+    '''
+    content_type = request.content_type
+    with timings.stage('parse'):
+        if content_type.startswith('image/') or content_type == 'application/octet-stream':
+            return request.read(settings.FACE_UPLOAD_MAX_BYTES) or None
+        if content_type == 'multipart/form-data':
+            upload = request.FILES.get('image')
+            return upload.read() if upload else None
+        image_data = json.loads(request.body.decode('utf-8')).get('image')
+    with timings.stage('base64_decode'):
+        return _decode_data_url(image_data) if image_data else None
+
+def _image_upload_items(request):
+    '''The batch endpoint's multipart ``images`` files or JSON ``{"images": [data_url, ...]}``, not yet read.
+
+    The caller can count them before any image is read or decoded.
+    '''
+    if request.content_type == 'multipart/form-data':
+        return request.FILES.getlist('images')
+    images = json.loads(request.body.decode('utf-8')).get('images')
+    return images if isinstance(images, list) else None
+
+def _read_image_item(item):
+    'Bytes of one item from ``_image_upload_items``, or None if it cannot be decoded.'
+    if not isinstance(item, str):
+        return item.read()
+    try:
+        return _decode_data_url(item)
+    except (ValueError, AttributeError):
+        return None
+
+def _upload_too_large(request, limit):
+    '''A 413 response if the declared body is over ``limit`` bytes, or None.
+
+    Checked before the body is read, so an oversized upload is never buffered.
+    '''
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length <= limit:
+        return None
+    return JsonResponse({'status': 'error', 'message': f'Upload larger than {limit} bytes'}, status=413)
+
+def _read_face_box(request):
+    'Optional ``X-Face-Box: top,right,bottom,left`` hint sent by clients that crop to the face.'
+    try:
+        box = tuple(int(value) for value in request.headers.get('X-Face-Box', '').split(','))
+    except ValueError:
+        return None
+    return box if len(box) == 4 else None
+
+def _kiosk_id(request):
+    'Kiosk sending a capture: the ``X-Kiosk-Id`` header, or the client address.'
+    return request.headers.get('X-Kiosk-Id') or request.META.get('REMOTE_ADDR', '')
+
+def _busy_response(exc):
+    response = JsonResponse({'status': 'error', 'message': str(exc)}, status=503)
+    response['Retry-After'] = str(exc.retry_after)
+    return response
+
 @csrf_exempt
 def recognize_view(request):
     'API endpoint to accept webcam capture and mark attendance if face matches'
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
-    if not face_recognition:
+    if not faces.available():
         return JsonResponse({'status': 'error', 'message': 'face_recognition library not installed'}, status=500)
-
-    data = json.loads(request.body.decode('utf-8'))
-    image_data = data.get('image')
-    if not image_data:
+    timings = metrics.start()
+    return timings.finish(_recognize(request, timings))
+
+def _recognize(request, timings):
+    too_large = _upload_too_large(request, settings.FACE_UPLOAD_MAX_BYTES)
+    if too_large:
+        timings.outcome('invalid')
+        return too_large
+    try:
+        image_bytes = _read_image_upload(request, timings)
+    except (ValueError, AttributeError):
+        timings.outcome('invalid')
+        return JsonResponse({'status': 'error', 'message': 'Invalid image'}, status=400)
+    if not image_bytes:
+        timings.outcome('invalid')
         return JsonResponse({'status': 'error', 'message': 'No image provided'}, status=400)
-    header, encoded = image_data.split(',', 1)
-    image_bytes = base64.b64decode(encoded)
-    image_stream = io.BytesIO(image_bytes)
-    image = face_recognition.load_image_file(image_stream)
-    faces_encodings = face_recognition.face_encodings(image)
+    try:
+        with timings.stage('inference_wait'):
+            faces_encodings, stages = get_inference().run(faces.encode_image_timed, image_bytes, _read_face_box(request), get_detection_profile('recognition'))
+    except InferenceUnavailable as exc:
+        timings.outcome('busy')
+        return _busy_response(exc)
+    except OSError:
+        timings.outcome('invalid')
+        return JsonResponse({'status': 'error', 'message': 'Invalid image'}, status=400)
+    timings.add_worker(stages, 'inference_wait')
     if not faces_encodings:
+        timings.outcome('no_face')
         return JsonResponse({'status': 'error', 'message': 'No face detected'}, status=400)
 
     found_encoding = faces_encodings[0]
-    # gather all stored employee encodings
-    all_profiles = EmployeeProfile.objects.exclude(face_encoding__isnull=True).exclude(face_encoding__exact='')
-    known_encodings = []
-    known_employee_ids = []
-    for profile in all_profiles:
-        try:
-            encoding_list = json.loads(profile.face_encoding)
-            known_encodings.append(encoding_list)
-            known_employee_ids.append(profile.employee_id)
-        except Exception:
-            continue
+    kiosk = _kiosk_id(request)
+    # the same person seen again at this kiosk a moment ago: already marked
+    recent_matches = get_recent_matches()
+    recent = recent_matches.lookup(kiosk, found_encoding)
+    if recent:
+        timings.outcome('recent')
+        return JsonResponse({'status': 'ok', 'employee': recent.employee, 'first_name': recent.first_name})
+
+    # closest enrolled employee from the in-memory gallery (of the kiosk's site first)
+    galleries = sites.galleries_for(kiosk)
+    with timings.stage('gallery_load'):
+        gallery_size = len(galleries[0])
+    with timings.stage('matching'):
+        match = sites.match(galleries, found_encoding)
+    if match and match.distance <= settings.FACE_MATCH_TOLERANCE:
+        timings.outcome('matched', match.distance, gallery_size)
+        with timings.stage('db'):
+            try:
+                matched_profile = EmployeeProfile.objects.select_related('user').get(pk=match.employee_id)
+            except EmployeeProfile.DoesNotExist:
+                return JsonResponse({'status': 'error', 'message': 'Matched profile not found'}, status=500)
 
-    import numpy as np
-    matches = face_recognition.compare_faces([np.array(e) for e in known_encodings], np.array(found_encoding), tolerance=0.5)
-    if True in matches:
-        matched_index = matches.index(True)
-        matched_employee_id = known_employee_ids[matched_index]
+            mark_present([matched_profile.pk], source=kiosk)
+        recent_matches.remember(kiosk, found_encoding, match, matched_profile.employee_id,
+                                matched_profile.user.first_name, settings.FACE_MATCH_TOLERANCE)
+        return JsonResponse({'status': 'ok', 'employee': matched_profile.employee_id, 'first_name': matched_profile.user.first_name})
+    else:
+        timings.outcome('no_match', match.distance if match else None, gallery_size)
+        return JsonResponse({'status': 'error', 'message': 'No match found'}, status=404)
+
+@csrf_exempt
+async def recognize_async_view(request):
+    '''Async variant of ``recognize_view`` for ASGI deployments.
+
+    Encoding is awaited from the inference pool, concurrent requests share
+    gallery searches through the per-loop ``MatchCoalescer`` and attendance is
+    written with the async ORM.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
+    if not faces.available():
+        return JsonResponse({'status': 'error', 'message': 'face_recognition library not installed'}, status=500)
+    timings = metrics.start()
+    return timings.finish(await _arecognize(request, timings))
+
+async def _arecognize(request, timings):
+    too_large = _upload_too_large(request, settings.FACE_UPLOAD_MAX_BYTES)
+    if too_large:
+        timings.outcome('invalid')
+        return too_large
+    try:
+        image_bytes = _read_image_upload(request, timings)
+    except (ValueError, AttributeError):
+        timings.outcome('invalid')
+        return JsonResponse({'status': 'error', 'message': 'Invalid image'}, status=400)
+    if not image_bytes:
+        timings.outcome('invalid')
+        return JsonResponse({'status': 'error', 'message': 'No image provided'}, status=400)
+    try:
+        with timings.stage('inference_wait'):
+            faces_encodings, stages = await get_inference().arun(faces.encode_image_timed, image_bytes, _read_face_box(request), get_detection_profile('recognition'))
+    except InferenceUnavailable as exc:
+        timings.outcome('busy')
+        return _busy_response(exc)
+    except OSError:
+        timings.outcome('invalid')
+        return JsonResponse({'status': 'error', 'message': 'Invalid image'}, status=400)
+    timings.add_worker(stages, 'inference_wait')
+    if not faces_encodings:
+        timings.outcome('no_face')
+        return JsonResponse({'status': 'error', 'message': 'No face detected'}, status=400)
+
+    found_encoding = faces_encodings[0]
+    kiosk = _kiosk_id(request)
+    recent_matches = get_recent_matches()
+    recent = recent_matches.lookup(kiosk, found_encoding)
+    if recent:
+        timings.outcome('recent')
+        return JsonResponse({'status': 'ok', 'employee': recent.employee, 'first_name': recent.first_name})
+
+    galleries = await sync_to_async(sites.galleries_for)(kiosk)
+    # includes the coalescing window
+    with timings.stage('matching'):
+        match = await sites.amatch(galleries, found_encoding)
+    # len() could reload a stale gallery through the ORM, which is not allowed on the event loop
+    gallery_size = galleries[0].loaded_size
+    if not match or match.distance > settings.FACE_MATCH_TOLERANCE:
+        timings.outcome('no_match', match.distance if match else None, gallery_size)
+        return JsonResponse({'status': 'error', 'message': 'No match found'}, status=404)
+    timings.outcome('matched', match.distance, gallery_size)
+    with timings.stage('db'):
         try:
-            matched_profile = EmployeeProfile.objects.get(employee_id=matched_employee_id)
+            matched_profile = await EmployeeProfile.objects.select_related('user').aget(pk=match.employee_id)
         except EmployeeProfile.DoesNotExist:
             return JsonResponse({'status': 'error', 'message': 'Matched profile not found'}, status=500)
 
-        today = date.today()
-        now_time = datetime.now().time()
-        attendance_record, created = Attendance.objects.get_or_create(employee=matched_profile, date=today,
-                                                                      defaults={'check_in_time': now_time, 'status': 'Present'})
-        if not created:
-            # already exists, update check_in_time only if empty
-            if not attendance_record.check_in_time:
-                attendance_record.check_in_time = now_time
-                attendance_record.save()
-        return JsonResponse({'status': 'ok', 'employee': matched_profile.employee_id, 'first_name': matched_profile.user.first_name})
-    else:
-        return JsonResponse({'status': 'error', 'message': 'No match found'}, status=404)
+        await amark_present([matched_profile.pk], source=kiosk)
+    recent_matches.remember(kiosk, found_encoding, match, matched_profile.employee_id,
+                            matched_profile.user.first_name, settings.FACE_MATCH_TOLERANCE)
+    return JsonResponse({'status': 'ok', 'employee': matched_profile.employee_id, 'first_name': matched_profile.user.first_name})
+
+@csrf_exempt
+def recognize_burst_view(request):
+    '''Recognize a burst of length-prefixed frames in one POST body (see attendance.burst).
+
+    Under ASGI ``BurstMiddleware`` answers these requests while the body is
+    still arriving; this view serves WSGI deployments, where it stops
+    encoding at the first frame that decides the burst.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
+    if not faces.available():
+        return JsonResponse({'status': 'error', 'message': 'face_recognition library not installed'}, status=500)
+
+    kiosk = _kiosk_id(request)
+    recognizer = burst.BurstRecognizer(kiosk)
+    try:
+        decision = None
+        while decision is None:
+            chunk = request.read(64 * 1024)
+            decision = recognizer.feed(chunk) if chunk else recognizer.close()
+    except burst.BurstError as exc:
+        return JsonResponse({'status': 'error', 'message': str(exc)}, status=400)
+    except OSError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid image'}, status=400)
+    except InferenceUnavailable as exc:
+        return _busy_response(exc)
+    status, payload = burst.complete(decision, kiosk)
+    return JsonResponse(payload, status=status)
+
+@csrf_exempt
+def recognize_batch_view(request):
+    '''Recognize every face in a batch of webcam captures and mark attendance for all matches.
+
+    Expects multipart ``images`` files or ``{"images": [data_url, ...]}``; all faces from all images are
+    matched against the gallery in one search and attendance is written with
+    a single insert.  Returns one result per detected face.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
+    if not faces.available():
+        return JsonResponse({'status': 'error', 'message': 'face_recognition library not installed'}, status=500)
+
+    too_large = _upload_too_large(request, settings.FACE_UPLOAD_MAX_BYTES * settings.FACE_BATCH_MAX_IMAGES)
+    if too_large:
+        return too_large
+    try:
+        items = _image_upload_items(request)
+    except (ValueError, AttributeError):
+        items = None
+    if not items:
+        return JsonResponse({'status': 'error', 'message': 'No images provided'}, status=400)
+    # count before reading: an over-long batch is turned away without decoding any of it
+    if len(items) > settings.FACE_BATCH_MAX_IMAGES:
+        return JsonResponse({'status': 'error', 'message': f'At most {settings.FACE_BATCH_MAX_IMAGES} images per request'}, status=400)
+    images = [_read_image_item(item) for item in items]
+
+    # encode the images in parallel on the inference pool, at most one job
+    # per worker at a time: a batch larger than the pool's queue is fed to
+    # it as jobs finish rather than turned away, and leaves the queue to
+    # other kiosks
+    inference = get_inference()
+    profile = get_detection_profile('recognition')
+    window = max(inference.workers, 1)
+    jobs = deque()
+    errors = []
+    detected = []
+    encodings = []
+
+    def collect():
+        image_index, job = jobs.popleft()
+        try:
+            image_encodings = inference.result(job)
+        except InferenceUnavailable:
+            raise
+        except Exception:
+            errors.append({'image': image_index, 'message': 'Invalid image'})
+            return
+        if not image_encodings:
+            errors.append({'image': image_index, 'message': 'No face detected'})
+        for face_index, encoding in enumerate(image_encodings):
+            detected.append((image_index, face_index))
+            encodings.append(encoding)
+
+    try:
+        collected = 0
+        for image_index, image_bytes in enumerate(images):
+            if not image_bytes:
+                errors.append({'image': image_index, 'message': 'Invalid image'})
+                continue
+            if len(jobs) >= window:
+                collect()
+                collected += 1
+            # a busy pool rejects the batch up front; later jobs take the slot a finished one frees
+            jobs.append((image_index, inference.submit(faces.encode_image, image_bytes, None, profile,
+                                                       block=collected > 0)))
+        while jobs:
+            collect()
+    except InferenceUnavailable as exc:
+        for _, job in jobs:
+            job.cancel()
+        return _busy_response(exc)
+
+    kiosk = _kiosk_id(request)
+    galleries = sites.galleries_for(kiosk)
+    matches = sites.match_many(galleries, np.array(encodings)) if encodings else []
+    matched_ids = {match.employee_id for match in matches
+                   if match and match.distance <= settings.FACE_MATCH_TOLERANCE}
+    profiles = EmployeeProfile.objects.select_related('user').in_bulk(matched_ids)
+    mark_present(profiles.keys(), source=kiosk)
+
+    results = []
+    for (image_index, face_index), match in zip(detected, matches):
+        result = {'image': image_index, 'face': face_index}
+        profile = profiles.get(match.employee_id) if match and match.employee_id in matched_ids else None
+        if profile:
+            result.update({'status': 'ok', 'employee': profile.employee_id,
+                           'first_name': profile.user.first_name, 'distance': round(match.distance, 4)})
+        else:
+            result.update({'status': 'error', 'message': 'No match found'})
+        results.append(result)
+
+    errors.sort(key=lambda error: error['image'])
+    return JsonResponse({'status': 'ok', 'results': results, 'errors': errors})
+
+_ABSENT = object()
+ATTENDANCE_ROWS_MARKER = '<!-- attendance-rows -->'
+
+def _attendance_grid(employees, dates, windows):
+    'Yield one present/absent entry per employee and date from prefetched ``{pk: {date: check_in}}`` windows.'
+    for employee in employees:
+        window = windows.get(employee.pk, {})
+        for current_date in dates:
+            check_in_time = window.get(current_date, _ABSENT)
+            if check_in_time is _ABSENT:
+                yield {'employee': employee, 'date': current_date, 'check_in_time': None, 'status': 'Absent'}
+            else:
+                yield {'employee': employee, 'date': current_date, 'check_in_time': check_in_time, 'status': 'Present'}
+
+def _stream_attendance_page(request, context, employees, dates, windows):
+    # render the page once around a marker and stream the table rows in chunks between the halves
+    page = render_to_string('attendance_list.html', {**context, 'streamed': True}, request=request)
+    head, tail = page.split(ATTENDANCE_ROWS_MARKER, 1)
+    chunk = settings.ATTENDANCE_LIST_STREAM_CHUNK
+
+    def content():
+        yield head
+        for start in range(0, len(employees), chunk):
+            yield render_to_string('attendance_list_rows.html', {
+                'entries': _attendance_grid(employees[start:start + chunk], dates, windows),
+            })
+        yield tail
+
+    return StreamingHttpResponse(content(), content_type='text/html; charset=utf-8')
 
 def attendance_list_view(request):
     if not request.user.is_authenticated:
@@ -258,46 +604,46 @@ def attendance_list_view(request):
     number_of_days = 30
     recent_dates = [today - timedelta(days=i) for i in range(number_of_days)]
 
-    attendance_entries = []
-
-    if request.user.is_staff:
-        # Admin can see all employees
-        employees = EmployeeProfile.objects.select_related('user').all()
-    else:
+    employees = EmployeeProfile.objects.select_related('user').order_by('employee_id')
+    if not request.user.is_staff:
         # Normal employee sees only own data
-        try:
-            employees = [EmployeeProfile.objects.select_related('user').get(user=request.user)]
-        except EmployeeProfile.DoesNotExist:
-            employees = []
-
-    for employee in employees:
-        records = Attendance.objects.filter(
-            employee=employee,
-            date__in=recent_dates
-        )
-
-        record_map = {record.date: record for record in records}
+        employees = employees.filter(user=request.user)
 
-        for current_date in recent_dates:
-            if current_date in record_map:
-                record = record_map[current_date]
-                attendance_entries.append({
-                    'employee': employee,
-                    'date': current_date,
-                    'check_in_time': record.check_in_time,
-                    'status': 'Present'
-                })
-            else:
-                attendance_entries.append({
-                    'employee': employee,
-                    'date': current_date,
-                    'check_in_time': None,
-                    'status': 'Absent'
-                })
+    try:
+        per_page = int(request.GET.get('per_page', settings.ATTENDANCE_LIST_PAGE_SIZE))
+    except ValueError:
+        per_page = settings.ATTENDANCE_LIST_PAGE_SIZE
+    per_page = min(max(per_page, 1), settings.ATTENDANCE_LIST_MAX_PAGE_SIZE)
+    paginator = Paginator(employees, per_page)
+    page_number = request.GET.get('page')
+
+    def load_page():
+        page = paginator.get_page(page_number)
+        return {'count': paginator.count, 'number': page.number, 'employees': list(page.object_list)}
+
+    viewer = 'staff' if request.user.is_staff else f'user:{request.user.pk}'
+    listing = caching.cached(f'list:{viewer}:{per_page}:{page_number}', ['profiles'], load_page)
+    paginator.count = listing['count']
+    page = Page(listing['employees'], listing['number'], paginator)
+    page_employees = listing['employees']
+
+    # cached per-employee windows; all misses are loaded with one query
+    windows = caching.recent_attendance([employee.pk for employee in page_employees], recent_dates)
+
+    context = {
+        'page': page,
+        'per_page': per_page,
+        'employees': employees if request.user.is_staff else [],  # for admin dropdown
+        'department_headcount': (caching.cached(f'headcount:{today}', ['headcount'], lambda: department_headcount(today))
+                                 if request.user.is_staff else {}),
+        'rows_marker': ATTENDANCE_ROWS_MARKER,
+    }
+    if len(page_employees) >= settings.ATTENDANCE_LIST_STREAM_THRESHOLD:
+        return _stream_attendance_page(request, context, page_employees, recent_dates, windows)
 
     return render(request, 'attendance_list.html', {
-        'entries': attendance_entries,
-        'employees': employees if request.user.is_staff else []  # for admin dropdown
+        **context,
+        'entries': _attendance_grid(page_employees, recent_dates, windows),
     })
 
 @staff_member_required
@@ -409,3 +755,114 @@ def download_attendance_excel(request):
 
     workbook.save(response)
     return response
+
+def _report_request(params):
+    '''Parse report parameters shared by the bulk export and report jobs.
+
+    Returns ``(employees, start_date, end_date, charts, department)`` or an
+    error ``HttpResponse``.  Employees are chosen with repeated
+    ``employee_id`` parameters (profile pks) and/or ``department``; with
+    neither, every employee is included.
+    '''
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    if not start_date or not end_date:
+        return HttpResponse('Date range is required', status=400)
+    try:
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+    except ValueError:
+        return HttpResponse('Dates must be YYYY-MM-DD', status=400)
+    if end_date < start_date:
+        return HttpResponse('End date is before start date', status=400)
+
+    employees = EmployeeProfile.objects.all()
+    employee_ids = [value for value in params.getlist('employee_id') if value]
+    if employee_ids:
+        employees = employees.filter(pk__in=employee_ids)
+    department = params.get('department', '')
+    if department:
+        employees = employees.filter(department=department)
+    return employees, start_date, end_date, params.get('charts') == '1', department
+
+@staff_member_required
+def download_attendance_bulk_excel(request):
+    '''Export many employees over a date range as one workbook (see ``_report_request``).
+
+    The workbook is spooled to a temporary file and streamed back in chunks.
+    '''
+    parsed = _report_request(request.GET)
+    if isinstance(parsed, HttpResponse):
+        return parsed
+    employees, start_date, end_date, charts, department = parsed
+
+    output = tempfile.TemporaryFile()
+    write_attendance_workbook(output, employees, start_date, end_date, charts=charts)
+    output.seek(0)
+
+    label = department or 'employees'
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f'{label}_{start_date}_to_{end_date}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+def _report_job_json(job):
+    data = {
+        'job_id': str(job.pk),
+        'status': job.status,
+        'status_url': reverse('report_status', args=[job.pk]),
+    }
+    if job.status == ReportJob.DONE:
+        data['download_url'] = reverse('report_download', args=[job.pk])
+    if job.status == ReportJob.FAILED:
+        data['error'] = job.error
+    return data
+
+@staff_member_required
+@require_POST
+def report_create_view(request):
+    '''Queue a bulk attendance report; identical requests reuse the cached file.'''
+    parsed = _report_request(request.POST)
+    if isinstance(parsed, HttpResponse):
+        return JsonResponse({'status': 'error', 'message': parsed.content.decode()}, status=parsed.status_code)
+    employees, start_date, end_date, charts, department = parsed
+
+    job = submit_report(request.user, employees, start_date, end_date, charts=charts, department=department)
+    return JsonResponse(_report_job_json(job), status=200 if job.status == ReportJob.DONE else 202)
+
+@staff_member_required
+def report_status_view(request, job_id):
+    job = get_object_or_404(ReportJob, pk=job_id)
+    fail_if_lost(job)
+    fail_if_file_missing(job)
+    return JsonResponse(_report_job_json(job))
+
+@staff_member_required
+def report_download_view(request, job_id):
+    job = get_object_or_404(ReportJob, pk=job_id, status=ReportJob.DONE)
+    if fail_if_file_missing(job):
+        raise Http404('The report file is no longer available')
+    return FileResponse(
+        job.file.open('rb'),
+        as_attachment=True,
+        filename=f'{job.department or "employees"}_{job.start_date}_to_{job.end_date}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+@staff_member_required
+def cache_stats_view(request):
+    'Hit/miss counters of the attendance cache in this worker process.'
+    return JsonResponse(caching.stats())
+
+def metrics_view(request):
+    'Recognition metrics of this worker process in the Prometheus text format (see attendance.metrics).'
+    if not metrics.enabled():
+        return HttpResponse('Metrics are disabled\n', status=404, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def ready_view(request):
+    'Readiness probe: 503 while this worker is still warming up (see attendance.warmup).'
+    state = get_warmup().status()
+    return JsonResponse(state, status=200 if state['status'] == 'ready' else 503)
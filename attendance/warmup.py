@@ -0,0 +1,132 @@
+'''Start-up warm-up for processes that recognize faces.
+
+A fresh web worker pays for its first recognition several times over: the
+inference processes are spawned and import face_recognition (and dlib, with
+its models), the first detection and encoding allocate dlib's buffers, and
+the gallery is read from the database.  With ``FACE_WARMUP['ENABLED']``,
+``AttendanceConfig.ready()`` starts a thread that does all of this before the
+first request arrives, and the ``ready/`` endpoint answers 503 until it has
+finished so a load balancer can hold traffic back.
+
+It is enabled per process through the ``FACE_WARMUP`` environment variable.
+Management commands other than ``runserver`` never warm up, and neither does
+the autoreloader's parent process, so ``migrate`` or ``enroll_employees``
+start as fast as they would without face recognition installed.
+'''
+import logging
+import os
+import sys
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# management commands that serve requests
+SERVER_COMMANDS = {'runserver'}
+
+
+class WarmUp:
+
+    def __init__(self, steps=('models', 'gallery')):
+        self.steps = list(steps)
+        self.enabled = False
+        self.timings = {}
+        self.error = None
+        self._done = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        'True once warm-up finished, or straight away when it is not enabled.'
+        return not self.enabled or (self._done.is_set() and self.error is None)
+
+    def start(self):
+        'Run the warm-up steps in a background thread.'
+        self.enabled = True
+        self._thread = threading.Thread(target=self.run, name='face-warmup', daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def run(self):
+        # the gallery step queries the database, which must wait until every app is ready
+        apps.ready_event.wait()
+        try:
+            for step in self.steps:
+                start = time.perf_counter()
+                getattr(self, f'_warm_{step}')()
+                self.timings[step] = time.perf_counter() - start
+                logger.info('Warm-up step %s took %.2fs', step, self.timings[step])
+        except Exception as exc:
+            self.error = f'{step}: {exc}'
+            logger.exception('Warm-up step %s failed', step)
+        finally:
+            self._done.set()
+
+    def _warm_models(self):
+        from . import faces
+        from .inference import get_inference
+
+        if not faces.available():
+            raise RuntimeError('face_recognition is not installed')
+        # one job per worker makes the pool spawn (and initialize) all of them
+        inference = get_inference()
+        futures = [inference.submit(faces.warm_up_inference) for _ in range(max(inference.workers, 1))]
+        for future in futures:
+            inference.result(future)
+
+    def _warm_gallery(self):
+        import numpy as np
+
+        from .encoding import ENCODING_SIZE
+        from .gallery import get_gallery
+
+        gallery = get_gallery()
+        if len(gallery):
+            # builds the matcher's index
+            gallery.match(np.zeros(ENCODING_SIZE, dtype=np.float32))
+
+    def status(self):
+        return {
+            'status': 'ready' if self.ready else ('failed' if self.error else 'warming'),
+            'warm_up': self.enabled,
+            'steps': {step: round(seconds, 3) for step, seconds in self.timings.items()},
+            'error': self.error,
+        }
+
+
+def should_warm_up(argv=None):
+    '''Whether this process should warm up: enabled, and not a management command that never recognizes faces.'''
+    if not getattr(settings, 'FACE_WARMUP', {}).get('ENABLED', False):
+        return False
+    argv = sys.argv if argv is None else argv
+    if argv and os.path.basename(argv[0]) == 'manage.py':
+        command = argv[1] if len(argv) > 1 else ''
+        if command not in SERVER_COMMANDS:
+            return False
+        # runserver's autoreloader parent only watches files; its child has RUN_MAIN set
+        if '--noreload' not in argv and os.environ.get('RUN_MAIN') != 'true':
+            return False
+    return True
+
+
+_warmup = None
+_warmup_lock = threading.Lock()
+
+
+def get_warmup():
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = WarmUp(getattr(settings, 'FACE_WARMUP', {}).get('STEPS', ('models', 'gallery')))
+        return _warmup
+
+
+def start_if_configured():
+    'Called from ``AttendanceConfig.ready()``.'
+    if should_warm_up():
+        get_warmup().start()
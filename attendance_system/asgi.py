@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings.dev')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from attendance.burst import BurstMiddleware  # noqa: E402  (needs the apps loaded)
+
+# burst recognition reads its frames as they arrive, ahead of Django's body buffering
+application = BurstMiddleware(django_application)
@@ -69,3 +69,181 @@ USE_I18N = True
 USE_TZ = True
 
 STATIC_URL = 'static/'
+
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Local memory by default. With several worker processes set CACHE_DIR (or
+# point CACHES at a shared backend) so cache invalidations reach every process.
+# attendance.caching keeps about four entries per employee (an attendance
+# version, the list and dashboard windows, the month count), so MAX_ENTRIES
+# must be several times the headcount; Django's default of 300 culls the
+# list page's own entries before the page has finished rendering.  The
+# default covers 5000 employees.
+CACHE_OPTIONS = {
+    'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 20000)),
+}
+if os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CACHE_DIR'],
+            'OPTIONS': CACHE_OPTIONS,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'attendance',
+            'OPTIONS': CACHE_OPTIONS,
+        }
+    }
+
+# Each process keeps the face gallery in memory (see attendance.gallery) and
+# reloads it when the cache above says another process changed an enrollment.
+# A local memory cache cannot tell other processes, so there galleries also
+# reload once they are MAX_AGE seconds old.
+FACE_GALLERY = {
+    'MAX_AGE': None if os.environ.get('CACHE_DIR') else 300,
+}
+
+# Cache used for dashboard/attendance list data (see attendance.caching)
+ATTENDANCE_CACHE_ALIAS = 'default'
+ATTENDANCE_CACHE_TIMEOUT = 300
+
+# Staff attendance list: employees per page (overridable up to the max with
+# ?per_page=), and pages with at least STREAM_THRESHOLD employees are streamed
+# STREAM_CHUNK employees at a time.
+ATTENDANCE_LIST_PAGE_SIZE = 50
+ATTENDANCE_LIST_MAX_PAGE_SIZE = 2000
+ATTENDANCE_LIST_STREAM_THRESHOLD = 200
+ATTENDANCE_LIST_STREAM_CHUNK = 50
+
+# Face matching: maximum distance for a match and the gallery search backend.
+# Use 'attendance.matching.IVFMatcher' for approximate search on large galleries.
+FACE_MATCH_TOLERANCE = 0.5
+
+# Maximum number of images accepted by the batch recognition endpoint
+FACE_BATCH_MAX_IMAGES = 16
+
+# Largest recognition request body, in bytes; larger uploads get a 413 before
+# they are read.  A batch request may be FACE_BATCH_MAX_IMAGES times this.
+FACE_UPLOAD_MAX_BYTES = 5 * 1024 * 1024
+
+FACE_MATCHER = {
+    'BACKEND': 'attendance.matching.BruteForceMatcher',
+    'OPTIONS': {},
+}
+
+# Opt-in client-side capture shrinking for the attendance kiosk: frames are
+# resized so the longer side is at most MAX_DIMENSION pixels and sent as
+# JPEG_QUALITY JPEG; FACE_CROP also crops to the face where the browser has
+# a FaceDetector and sends the box as an X-Face-Box hint.  With BURST_FRAMES
+# the kiosk sends up to that many frames, BURST_INTERVAL_MS apart, to the
+# burst endpoint in one request instead (see FACE_BURST).
+FACE_CAPTURE = {
+    'MAX_DIMENSION': None,
+    'JPEG_QUALITY': 0.85,
+    'FACE_CROP': False,
+    'BURST_FRAMES': 0,
+    'BURST_INTERVAL_MS': 150,
+}
+
+# Face detection/encoding parameters per use (see attendance.faces.DEFAULT_PROFILE).
+# SCALE < 1 detects on a downscaled copy, encodings stay at full resolution.
+# Compare profiles on your own images with 'manage.py benchmark detection_profiles --images DIR'.
+FACE_DETECTION_PROFILES = {
+    'recognition': {'SCALE': 1.0, 'UPSAMPLE': 1, 'MODEL': 'hog', 'NUM_JITTERS': 1},
+    'enrollment': {'SCALE': 1.0, 'UPSAMPLE': 1, 'MODEL': 'hog', 'NUM_JITTERS': 1},
+    'burst': {'SCALE': 1.0, 'UPSAMPLE': 1, 'MODEL': 'hog', 'NUM_JITTERS': 1},
+}
+
+# Enrollment images are rejected unless they show exactly one face at least
+# MIN_FACE_SIZE pixels across with a Laplacian variance (sharpness) of at
+# least MIN_SHARPNESS (see attendance.faces.DEFAULT_QUALITY).
+FACE_ENROLLMENT_QUALITY = {
+    'MIN_FACE_SIZE': 80,
+    'MIN_SHARPNESS': 30.0,
+}
+
+# Enrollment keeps the newest MAX_PER_EMPLOYEE captures per employee as
+# templates and matches against their centroid; the RERANK nearest centroids
+# are re-scored by their closest template (0 matches centroids only).
+# Compare settings with 'manage.py evaluate_recognition --images DIR'.
+FACE_TEMPLATES = {
+    'MAX_PER_EMPLOYEE': 5,
+    'RERANK': 8,
+}
+
+# Async recognition (served through attendance_system.asgi) groups gallery
+# searches that arrive within WINDOW seconds into one vectorized call.
+FACE_MATCH_COALESCING = {
+    'WINDOW': 0.005,
+    'MAX_BATCH': 64,
+}
+
+# Repeated captures of someone already marked at the same kiosk are answered
+# from memory for TTL seconds (see attendance.recent); TTL = 0 disables it.
+# RADIUS caps the encoding distance at which a remembered match is reused.
+FACE_RECENT_MATCHES = {
+    'TTL': 10,
+    'MAX_ENTRIES': 256,
+    'RADIUS': 0.2,
+}
+
+# Burst recognition (see attendance.burst): up to MAX_FRAMES frames of at most
+# MAX_FRAME_BYTES each per request.  A frame decides the burst when its match
+# is MIN_MARGIN clearer than the runner-up and, with REQUIRE_LIVENESS, the
+# face moved between two consecutive frames (normalized thumbnail difference
+# between MIN_MOTION and MAX_MOTION).
+FACE_BURST = {
+    'MAX_FRAMES': 8,
+    'MAX_FRAME_BYTES': 256 * 1024,
+    'MIN_MARGIN': 0.08,
+    'REQUIRE_LIVENESS': True,
+    'MIN_MOTION': 0.08,
+    'MAX_MOTION': 0.8,
+}
+
+# Face encoding runs in a pool of worker processes (see attendance.inference).
+# WORKERS = 0 encodes inline in the request thread.  The pool is per web
+# process: N web workers start N x WORKERS encoding processes, so raise it
+# only when few web workers share the machine's cores.
+FACE_INFERENCE = {
+    'WORKERS': int(os.environ.get('FACE_INFERENCE_WORKERS', 1)),
+    'MAX_QUEUE': int(os.environ.get('FACE_INFERENCE_MAX_QUEUE', 8)),
+    'TIMEOUT': 10,
+    'RETRY_AFTER': 2,
+}
+
+# Start-up warm-up (see attendance.warmup): spawn the inference workers, load
+# the face models and the gallery before the first request; 'ready/' answers
+# 503 until then. Enable it per process with FACE_WARMUP=1 on web workers.
+FACE_WARMUP = {
+    'ENABLED': os.environ.get('FACE_WARMUP', '') == '1',
+    'STEPS': ['models', 'gallery'],
+}
+
+# Recognition stage timings and outcome counters (see attendance.metrics),
+# served in the Prometheus text format at 'metrics/'; SERVER_TIMING also
+# sends the stage times in a Server-Timing response header.
+FACE_METRICS = {
+    'ENABLED': os.environ.get('FACE_METRICS', '') == '1',
+    'SERVER_TIMING': os.environ.get('FACE_SERVER_TIMING', '') == '1',
+}
+
+# Attendance event history (see attendance.events): events are written in
+# batches of BATCH_SIZE, or FLUSH_INTERVAL seconds after the first one
+ATTENDANCE_EVENTS = {
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+# Background report generation (see attendance.jobs): worker threads per
+# process, seconds after which an unfinished job no process is working on
+# is taken as lost to a restart, and seconds a finished job and its file are
+# kept
+REPORT_WORKERS = 2
+REPORT_JOB_TIMEOUT = 900
+REPORT_RETENTION = 7 * 24 * 3600
@@ -10,6 +10,17 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # take the write lock when a transaction starts, so concurrent kiosk
+        # posts queue up instead of failing with "database is locked"
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # tests use a file too: a shared-cache in-memory database fails
+        # concurrent writers with "table is locked" (see MarkingRaceTests)
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 